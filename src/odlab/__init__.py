@@ -11,6 +11,7 @@ from . import profiling
 from . import times
 from . import methods
 from . import statistics
+from . import batch
 
 from .methods import POSTERIORS, SOLVERS
 from .data import load_source, glob_sources, build_source, SOURCES
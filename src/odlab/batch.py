@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+
+"""
+Batch orbit determination of many objects from a job manifest
+
+The manifest is a JSON file with a list of "jobs" and optional "defaults" that
+are used for all keys missing from a job, e.g.
+
+    {
+        "defaults": {
+            "model": "radar_pair",
+            "epoch": "2009-05-01T02:37:00",
+            "propagator": {"name": "Kepler", "settings": {"in_frame": "TEME"}},
+            "solver": "scipy_maximize",
+            "options": {"method": "Nelder-Mead", "progress_bar": false}
+        },
+        "jobs": [
+            {"id": "obj1", "path": "data/obj1", "sources": {"radar_hdf": "*.h5"},
+             "start": [7000e3, 0, 0, 0, 7.5e3, 0]}
+        ]
+    }
+
+Each job loads its sources with `glob_sources`, relative paths are relative to
+the manifest. The state generator is either a `sortsPropagator` built from the
+"propagator" entry or a "module:callable" given as "state_generator" that is
+called with the epoch and the "state_generator_args". The solver is constructed
+from `SOLVERS` with the "solver_args" and "options" and run with the "start"
+state and the "run_args".
+
+"""
+import argparse
+import importlib
+import json
+import logging
+import multiprocessing
+import multiprocessing.connection
+import time
+import traceback
+from collections import deque
+from pathlib import Path
+
+import numpy as np
+from astropy.time import Time
+
+from .data import glob_sources
+from .instrument_models import source_to_model
+from .methods import POSTERIORS, SOLVERS, sortsPropagator
+
+logger = logging.getLogger(__name__)
+
+JOB_DEFAULTS = {
+    "posterior": "gaussian_error",
+    "solver_args": [],
+    "options": {},
+    "run_args": {},
+    "state_generator": None,
+    "state_generator_args": {},
+    "propagator": None,
+}
+
+
+def load_manifest(path):
+    """Load a job manifest and return the jobs with the defaults applied"""
+    path = Path(path)
+    with open(path, "r") as fh:
+        manifest = json.load(fh)
+
+    defaults = dict(JOB_DEFAULTS)
+    defaults.update(manifest.get("defaults", {}))
+
+    jobs = []
+    for job in manifest["jobs"]:
+        full_job = dict(defaults)
+        full_job.update(job)
+        job_path = Path(full_job.get("path", "."))
+        if not job_path.is_absolute():
+            job_path = path.parent / job_path
+        full_job["path"] = str(job_path)
+        jobs.append(full_job)
+    return jobs
+
+
+def job_size(job):
+    """Size of a job used for scheduling, the total size in bytes of its source
+    files. This is a proxy for the number of measurements that does not need to
+    load the sources, which would mean reading the whole dataset before any job
+    starts.
+    """
+    path = Path(job["path"])
+    return sum(
+        file.stat().st_size
+        for regex in job["sources"].values()
+        for file in path.glob(regex)
+    )
+
+
+def build_state_generator(job):
+    epoch = Time(job["epoch"], format="isot", scale="utc")
+    if job["state_generator"] is not None:
+        module_name, name = job["state_generator"].split(":")
+        generator = getattr(importlib.import_module(module_name), name)
+        return generator(epoch, **job["state_generator_args"])
+
+    import sorts
+
+    config = job["propagator"]
+    propagator = getattr(sorts.propagator, config["name"])(settings=config.get("settings", {}))
+    return sortsPropagator(epoch, propagator, propagator_args=config.get("args", {}))
+
+
+def _serialize(value, name, results_dir, max_size):
+    """Convert a solver result to JSON, arrays larger than `max_size` elements
+    are saved as separate numpy files.
+    """
+    if isinstance(value, np.ndarray):
+        if value.size > max_size:
+            file = results_dir / f"{name}.npy"
+            np.save(file, value)
+            return {"npy": file.name}
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, Time):
+        return value.isot.tolist() if value.ndim > 0 else value.isot
+    if isinstance(value, dict):
+        return {
+            str(key): _serialize(val, f"{name}_{key}", results_dir, max_size)
+            for key, val in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [
+            _serialize(val, f"{name}_{ind}", results_dir, max_size)
+            for ind, val in enumerate(value)
+        ]
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return repr(value)
+
+
+def run_job(job, results_dir=None, max_array_size=10000):
+    """Run the orbit determination of one job and return the JSON serializable result"""
+    dfs = glob_sources(Path(job["path"]), job["sources"])
+    if len(dfs) == 0:
+        raise ValueError(f"No sources found for job {job['id']}")
+
+    measurements = [(source_to_model(df, job["model"]), [df]) for df in dfs]
+    posterior = POSTERIORS[job["posterior"]](measurements, build_state_generator(job))
+    solver = SOLVERS[job["solver"]](*job["solver_args"], **job["options"])
+
+    result = solver.run(posterior, np.array(job["start"], dtype=np.float64), **job["run_args"])
+
+    results_dir = Path(".") if results_dir is None else Path(results_dir)
+    return _serialize(result, str(job["id"]), results_dir, max_array_size)
+
+
+def _job_worker(job, results_dir, max_array_size, conn):
+    try:
+        result = run_job(job, results_dir=results_dir, max_array_size=max_array_size)
+        conn.send(("done", result))
+    except Exception:
+        conn.send(("failed", traceback.format_exc()))
+    finally:
+        conn.close()
+
+
+def load_results(path):
+    """Load the latest result record of each job id from a results file"""
+    path = Path(path)
+    records = {}
+    if not path.is_file():
+        return records
+    with open(path, "r") as fh:
+        for line in fh:
+            if line.strip():
+                record = json.loads(line)
+                records[record["id"]] = record
+    return records
+
+
+def run_batch(
+    jobs,
+    results_path,
+    processes=None,
+    timeout=None,
+    retries=0,
+    skip_done=True,
+    max_array_size=10000,
+    poll_interval=0.1,
+):
+    """Run jobs with one process per job on up to `processes` concurrent processes.
+
+    Jobs are started largest first according to their source file size `job_size`
+    so that the longest jobs do not end up last (longest processing time
+    scheduling). A job running longer than `timeout` seconds is terminated, failed
+    and timed out jobs are retried up to `retries` times.
+
+    One JSON record per finished job is appended to the `results_path` file, with
+    the job "id", "status" ("done", "failed" or "timeout"), number of "attempts",
+    "runtime" and the "result" or "error". Jobs with a "done" record are skipped
+    if `skip_done` is set, which makes it possible to continue an interrupted batch.
+
+    Returns the records of the jobs run.
+    """
+    results_path = Path(results_path)
+    results_dir = results_path.parent
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+
+    if skip_done:
+        done = {
+            key for key, record in load_results(results_path).items()
+            if record["status"] == "done"
+        }
+        jobs = [job for job in jobs if job["id"] not in done]
+
+    pending = deque(
+        (job, 1) for job in sorted(jobs, key=job_size, reverse=True)
+    )
+    running = {}
+    records = []
+
+    def finish(job, attempt, status, runtime, payload):
+        if status != "done" and attempt <= retries:
+            logger.warning(f"Job {job['id']} {status} on attempt {attempt}, retrying")
+            pending.append((job, attempt + 1))
+            return
+        record = dict(id=job["id"], status=status, attempts=attempt, runtime=runtime)
+        record["result" if status == "done" else "error"] = payload
+        records.append(record)
+        with open(results_path, "a") as fh:
+            fh.write(json.dumps(record) + "\n")
+        logger.info(f"Job {job['id']} {status} after {runtime:.1f} s")
+
+    while len(pending) > 0 or len(running) > 0:
+        while len(pending) > 0 and len(running) < processes:
+            job, attempt = pending.popleft()
+            recv_conn, send_conn = multiprocessing.Pipe(duplex=False)
+            proc = multiprocessing.Process(
+                target=_job_worker,
+                args=(job, results_dir, max_array_size, send_conn),
+            )
+            proc.start()
+            send_conn.close()
+            running[recv_conn] = (proc, job, attempt, time.monotonic())
+
+        ready = multiprocessing.connection.wait(list(running.keys()), timeout=poll_interval)
+        now = time.monotonic()
+        for conn in list(running.keys()):
+            proc, job, attempt, start = running[conn]
+            if conn in ready:
+                try:
+                    status, payload = conn.recv()
+                except EOFError:
+                    status, payload = "failed", f"Process exited with code {proc.exitcode}"
+            elif timeout is not None and now - start > timeout:
+                proc.terminate()
+                status, payload = "timeout", f"Exceeded timeout of {timeout} s"
+            else:
+                continue
+
+            proc.join()
+            conn.close()
+            del running[conn]
+            finish(job, attempt, status, now - start, payload)
+
+    return records
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch orbit determination of a job manifest")
+    parser.add_argument("manifest", type=Path, help="Path to the JSON job manifest")
+    parser.add_argument(
+        "-r", "--results", type=Path, default=None,
+        help="Results file, defaults to 'results.jsonl' next to the manifest",
+    )
+    parser.add_argument("-p", "--processes", type=int, default=None, help="Concurrent jobs")
+    parser.add_argument("-t", "--timeout", type=float, default=None, help="Job timeout [s]")
+    parser.add_argument("--retries", type=int, default=0, help="Retries of failed jobs")
+    parser.add_argument(
+        "--rerun", action="store_true", help="Also run jobs that are already done",
+    )
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    results = args.results
+    if results is None:
+        results = args.manifest.parent / "results.jsonl"
+
+    records = run_batch(
+        load_manifest(args.manifest),
+        results,
+        processes=args.processes,
+        timeout=args.timeout,
+        retries=args.retries,
+        skip_done=not args.rerun,
+    )
+    failed = [record["id"] for record in records if record["status"] != "done"]
+    if len(failed) > 0:
+        logger.error(f"{len(failed)} jobs not done: {failed}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
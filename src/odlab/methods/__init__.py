@@ -15,4 +15,5 @@ from . import solvers
 
 from .solvers import SOLVERS
 from .posterior import POSTERIORS
-from .state_generator import StateGenerator, sortsPropagator
\ No newline at end of file
+from .state_generator import StateGenerator, sortsPropagator
+from .state_generator import CachedStateGenerator, InterpolatedStateGenerator
\ No newline at end of file
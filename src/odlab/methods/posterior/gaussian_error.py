@@ -6,82 +6,226 @@
 import logging
 
 import numpy as np
+import scipy.linalg as linalg
 
 from .posterior import Posterior, register_posterior
 
 logger = logging.getLogger(__name__)
 
 
+def information_matrix(J, inv_sd, chunk_size=65536):
+    """Calculate the information matrix $J^T \\Sigma_m^{-1} J$ for diagonal
+    measurement errors given as inverse standard deviations, without forming
+    the dense measurement weight matrix.
+    """
+    n_var = J.shape[1]
+    information = np.zeros((n_var, n_var), dtype=np.float64)
+    for start in range(0, J.shape[0], chunk_size):
+        Jw = J[start:(start + chunk_size), :] * inv_sd[start:(start + chunk_size), None]
+        information += Jw.T @ Jw
+    return information
+
+
+def invert_information(information):
+    """Invert an information matrix into a covariance using a Cholesky factorization,
+    falls back to a general inverse if the matrix is not positive definite.
+    """
+    n_var = information.shape[0]
+    try:
+        factor = linalg.cho_factor(information)
+        return linalg.cho_solve(factor, np.eye(n_var, dtype=np.float64))
+    except linalg.LinAlgError:
+        logger.warning("Information matrix not positive definite, using general inverse")
+        return np.linalg.inv(information)
+
+
 @register_posterior("gaussian_error")
 class GaussianError(Posterior):
 
-    def model_jacobian_estimate(self, state, deltas):
+    def _jacobian_estimate(self, state, deltas, central=False):
+        """Simulate the flat measurement layout of a state and its numerical Jacobean,
+        all perturbed states are propagated together as one batch.
+        """
+        n_var = len(state)
+        deltas = np.broadcast_to(np.asarray(deltas, dtype=np.float64), (n_var,))
+
+        n_perturb = 2 * n_var if central else n_var
+        dstates = np.tile(np.asarray(state, dtype=np.float64), (n_perturb + 1, 1))
+        var_inds = np.arange(n_var)
+        dstates[1 + var_inds, var_inds] += deltas
+        if central:
+            dstates[1 + n_var + var_inds, var_inds] -= deltas
+
+        sims = self._simulate_batch(dstates)
+        sim0 = sims[0, :]
+        if central:
+            J = (sims[1:(n_var + 1), :] - sims[(n_var + 1):, :]).T / (2 * deltas[None, :])
+        else:
+            J = (sims[1:, :] - sim0[None, :]).T / deltas[None, :]
+
+        return sim0, J
+
+    def model_jacobian_estimate(self, state, deltas, central=False):
         """Calculate the observation and its numerical Jacobean
         of a state given the current models.
+
+        All perturbed states are propagated together as one batch through
+        the state generator. If `central` is set, central differences are used
+        at the cost of twice the number of perturbed states.
         """
-        states = self.state_generator.get_states(state, self.times)
-
-        meas_n = np.sum([
-            len(df)*len(model.OUTPUT_DATA) 
-            for model, df in zip(self.models, self.dfs)
-        ])
-        J = np.zeros([meas_n, len(state)], dtype=np.float64)
-        data0 = []
-        Sigma = np.zeros((meas_n,), dtype=np.float64)
-        Sigma_cursor = 0
-        for ind, (model, df) in enumerate(zip(self.models, self.dfs)):
-            df_state_inds = self._times_expand_index[self._times_df_map == ind]
-
-            sim_data = model.evaluate(df["date"], states[:, df_state_inds])
-            data0.append(sim_data)
-
-            Sigma_step = len(df)
-            for ind, var in enumerate(model.OUTPUT_DATA):
-                Sigma[Sigma_cursor:(Sigma_cursor + Sigma_step)] = df[var + "_sd"]**2
-                Sigma_cursor += Sigma_step
-
-        for vind in range(len(state)):
-            dstate = np.copy(state)
-            dstate[vind] += deltas[vind]
-
-            states = self.state_generator.get_states(dstate, self.times)
-
-            J_cursor = 0
-            for ind, (model, df) in enumerate(zip(self.models, self.dfs)):
-                df_state_inds = self._times_expand_index[self._times_df_map == ind]
-                sim_data = data0[ind]
-                dsim_data = model.evaluate(df["date"], states[:, df_state_inds])
-
-                J_step = len(df)
-                for ind, var in enumerate(model.OUTPUT_DATA):
-                    ddata = (dsim_data[var] - sim_data[var]) / deltas[ind]
-                    J[J_cursor:(J_cursor + J_step), vind] = ddata
-                    J_cursor += J_step
+        sim0, J = self._jacobian_estimate(state, deltas, central=central)
+
+        data0 = [
+            {var: sim0[var_slice] for var, var_slice in slices.items()}
+            for slices in self._var_slices
+        ]
+        Sigma = 1.0 / self._inv_sd**2
 
         return data0, J, Sigma
 
-    def linear_covariance_estimate(self, state, deltas, prior_cov_inv=None):
-        data0, J, Sigma_m_diag = self.model_jacobian_estimate(state, deltas)
-        Sigma_m_inv = np.diag(1.0 / Sigma_m_diag)
+    def whitened_residuals(self, state):
+        """The residuals normalized by the measurement standard deviations"""
+        return (self._obs - self._simulate(state)) * self._inv_sd
+
+    def whitened_jacobian_estimate(self, state, deltas, central=False):
+        """Calculate the whitened residuals and the numerical Jacobean of the
+        whitened model, i.e. the model normalized by the measurement standard deviations.
+        """
+        sim0, J = self._jacobian_estimate(state, deltas, central=central)
+        return (self._obs - sim0) * self._inv_sd, J * self._inv_sd[:, None]
 
-        if prior_cov_inv is None:
-            Sigma_orb = np.linalg.inv(np.transpose(J) @ Sigma_m_inv @ J)
+    def linear_covariance_estimate(
+        self, state, deltas, prior_cov_inv=None, central=False, chunk_size=65536
+    ):
+        """Linearized posterior covariance estimate at a state using the numerical Jacobean.
+
+        The information matrix is accumulated from row-scaled chunks of the
+        Jacobean, so memory use is linear in the number of measurements, and
+        inverted using a Cholesky factorization.
+        """
+        _, J = self._jacobian_estimate(state, deltas, central=central)
+        information = information_matrix(J, self._inv_sd, chunk_size=chunk_size)
+
+        if prior_cov_inv is not None:
+            information += prior_cov_inv
+
+        return invert_information(information)
+
+    def unscented_covariance_estimate(
+        self,
+        state,
+        deltas,
+        prior_cov_inv=None,
+        cov=None,
+        alpha=1.0,
+        beta=2.0,
+        kappa=0.0,
+        maxiter=10,
+        tol=1e-3,
+        linearization_error=True,
+        chunk_size=65536,
+    ):
+        """Posterior mean and covariance estimate using iterated statistical linear
+        regression of the models over unscented sigma points [1].
+
+        Each iteration propagates the 2n+1 sigma points of the current mean and
+        covariance as one batch, replaces the Jacobean by the regression of the
+        simulated measurements on the sigma points and takes a Gauss-Newton step
+        toward the maximum a posteriori state. If `linearization_error` is set, the
+        variance of the measurements not explained by the regression is added to
+        the measurement variances. The iteration stops when the step is smaller than
+        `tol` standard deviations.
+
+        The starting covariance is `cov`, or the linearized covariance at `state`
+        using the `deltas` if not given. As with `linear_covariance_estimate` the
+        prior only enters through its inverse covariance `prior_cov_inv`.
+
+        [1] Garcia-Fernandez, A. F., Svensson, L., Morelande, M. R., Sarkka, S. (2015).
+            Posterior linearization filter: Principles and implementation using
+            sigma points. IEEE Transactions on Signal Processing, 63(20), 5561-5573.
+
+        Returns
+        -------
+        numpy.ndarray
+            The (n,) estimated state
+        numpy.ndarray
+            The (n, n) estimated covariance
+        """
+        mean = np.array(state, dtype=np.float64)
+        n_var = len(mean)
+        if cov is None:
+            cov = self.linear_covariance_estimate(
+                mean, deltas, prior_cov_inv=prior_cov_inv, chunk_size=chunk_size,
+            )
+
+        lam = alpha**2 * (n_var + kappa) - n_var
+        wm = np.full((2 * n_var + 1,), 0.5 / (n_var + lam), dtype=np.float64)
+        wc = wm.copy()
+        wm[0] = lam / (n_var + lam)
+        wc[0] = wm[0] + 1.0 - alpha**2 + beta
+
+        for it in range(maxiter):
+            L = np.linalg.cholesky(cov) * np.sqrt(n_var + lam)
+            sigma = np.concatenate([mean[None, :], mean[None, :] + L.T, mean[None, :] - L.T])
+            sims = self._simulate_batch(sigma)
+
+            ybar = wm @ sims
+            dy = sims - ybar[None, :]
+            dx = sigma - mean[None, :]
+            Pxy = (dx * wc[:, None]).T @ dy
+            # Regression of the measurements on the state, transposed (n, size)
+            A_T = np.linalg.solve(cov, Pxy)
+
+            inv_sd = self._inv_sd
+            if linearization_error:
+                residual_var = wc @ dy**2 - np.sum(A_T * Pxy, axis=0)
+                inv_sd = 1.0 / np.sqrt(1.0 / inv_sd**2 + np.maximum(residual_var, 0.0))
+
+            information = information_matrix(A_T.T, inv_sd, chunk_size=chunk_size)
+            if prior_cov_inv is not None:
+                information += prior_cov_inv
+            gradient = A_T @ ((self._obs - ybar) * inv_sd**2)
+
+            step = linalg.solve(information, gradient, assume_a="pos")
+            mean = mean + step
+            cov = invert_information(information)
+
+            norm = np.sqrt(np.dot(step, information @ step))
+            logger.debug(f"Unscented iteration {it}: step of {norm:.3e} standard deviations")
+            if norm < tol:
+                break
         else:
-            Sigma_orb = np.linalg.inv(np.transpose(J) @ Sigma_m_inv @ J + prior_cov_inv)
+            logger.warning(f"Unscented covariance estimate not converged in {maxiter} iterations")
 
-        return Sigma_orb
+        return mean, cov
+
+    def linearized_logposterior(self, state, deltas, central=False, chunk_size=65536):
+        """Cheap surrogate of the log posterior with the models linearized around a
+        reference state using the numerical Jacobean.
+
+        The least squares is expanded into the gradient $b = J^T \\Sigma_m^{-1} r_0$
+        and the information matrix $H$ at the reference, so evaluating the returned
+        function costs $O(n^2)$ for n variables and no propagation.
+        """
+        state0 = np.array(state, dtype=np.float64)
+        sim0, J = self._jacobian_estimate(state0, deltas, central=central)
+        resid = (self._obs - sim0) * self._inv_sd
+        loglik0 = -0.5 * np.dot(resid, resid)
+        b = J.T @ (resid * self._inv_sd)
+        H = information_matrix(J, self._inv_sd, chunk_size=chunk_size)
+
+        def surrogate(state):
+            dx = state - state0
+            return self.logprior(state) + loglik0 + np.dot(b, dx) - 0.5 * dx @ H @ dx
+
+        return surrogate
 
     def loglikelihood(self, state):
         """The log likelihood function"""
-        states = self.state_generator.get_states(state, self.times)
-
-        logsum = 0.0
-        for ind, (model, df) in enumerate(zip(self.models, self.dfs)):
-            df_state_inds = self._times_expand_index[self._times_df_map == ind]
-            sim_data = model.evaluate(df["date"], states[:, df_state_inds])
-
-            diffs = {}
-            for var in sim_data:
-                diffs[var] = (df[var].values - sim_data[var])
-                logsum -= np.sum((diffs[var] / df[var + "_sd"].values) ** 2)
-        return 0.5 * logsum
+        norm_diffs = self.whitened_residuals(state)
+        return -0.5 * np.dot(norm_diffs, norm_diffs)
+
+    def loglikelihood_batch(self, states):
+        """The log likelihood function evaluated on a (K, n_var) batch of states"""
+        norm_diffs = (self._obs[None, :] - self._simulate_batch(states)) * self._inv_sd[None, :]
+        return -0.5 * np.sum(norm_diffs**2, axis=1)
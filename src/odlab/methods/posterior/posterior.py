@@ -5,6 +5,7 @@
 """
 # import copy
 import logging
+import time
 
 import numpy as np
 import pandas as pd
@@ -35,6 +36,8 @@ class Posterior:
         self.prior = prior
 
         self.state_generator = state_generator
+        # Accumulated time [s] spent in the state generator and in the models
+        self.timing = dict(propagation=0.0, models=0.0)
 
         self.models = []
         self.dfs = []
@@ -43,32 +46,208 @@ class Posterior:
             self.dfs.append(pd.concat(dfs))
 
         self._reduce_and_set_df_times()
+        self._compile_measurements()
 
     def _reduce_and_set_df_times(self):
         """Find all the input measurements times and reduce to only unique ones 
         into a single list and set indices mapping back to the original measurements
         """
-        times = np.concatenate([df["date"].values for df in self.dfs])
+        if len(self.dfs) > 0:
+            times = np.concatenate([df["date"].values for df in self.dfs])
+        else:
+            times = np.empty((0,), dtype="datetime64[ns]")
         utimes, indices = np.unique(times, return_inverse=True)
         self._times_df_map = np.concatenate([
             np.full((len(df),), ind, dtype=np.int64)
             for ind, df in enumerate(self.dfs)
-        ])
-        self._times_expand_index = indices
+        ] + [np.empty((0,), dtype=np.int64)])
+        self._times_expand_index = indices.astype(np.int64)
+        self._utimes = utimes
         self.times = Time(utimes, format="datetime64", scale="utc")
 
-    def residuals(self, state):
-        resids = []
-        states = self.state_generator.get_states(state, self.times)
+    def _compile_measurements(self):
+        """Compile all measurements into flat contiguous arrays so that evaluating
+        the posterior does not need to access the DataFrames.
+
+        The flat layout is ordered by model and then by the models `OUTPUT_DATA`
+        variables, `self._var_slices` holds the per-model slices into it.
+        """
+        self._state_inds = []
+        self._dates = []
+        self._var_slices = []
+        self.size = 0
+        obs = []
+        inv_sd = []
 
         for ind, (model, df) in enumerate(zip(self.models, self.dfs)):
-            df_state_inds = self._times_expand_index[self._times_df_map == ind]
-            sim_data = model.evaluate(df["date"], states[:, df_state_inds])
+            state_inds = self._times_expand_index[self._times_df_map == ind]
+            model_obs, model_inv_sd = self._compile_model(model, df, state_inds)
+            obs += model_obs
+            inv_sd += model_inv_sd
+
+        self._obs = np.concatenate(obs + [np.empty((0,), dtype=np.float64)])
+        self._inv_sd = np.concatenate(inv_sd + [np.empty((0,), dtype=np.float64)])
+
+    def _compile_model(self, model, df, state_inds):
+        """Append the layout of one model to the end of the flat measurement layout
+        and return the observations and inverse standard deviations to append
+        """
+        self._state_inds.append(state_inds)
+        self._dates.append(df["date"].values)
+
+        obs = []
+        inv_sd = []
+        slices = {}
+        for var in model.OUTPUT_DATA:
+            slices[var] = slice(self.size, self.size + len(df))
+            self.size += len(df)
+            obs.append(df[var].values.astype(np.float64))
+            inv_sd.append(1.0 / df[var + "_sd"].values.astype(np.float64))
+        self._var_slices.append(slices)
+
+        return obs, inv_sd
+
+    def add_measurements(self, model, dfs):
+        """Add the measurements of a model to the posterior without rebuilding it.
+
+        The new times are merged into the existing unique times and only the layout
+        of the new measurements is compiled. If the new measurements are all after
+        the existing ones no existing indices need to be updated.
+        """
+        df = pd.concat(dfs)
+        new_utimes, new_inverse = np.unique(df["date"].values, return_inverse=True)
+
+        pos = np.searchsorted(self._utimes, new_utimes)
+        exists = pos < len(self._utimes)
+        exists[exists] = self._utimes[pos[exists]] == new_utimes[exists]
+        inserted = new_utimes[np.logical_not(exists)]
+
+        if len(inserted) > 0:
+            if len(self._utimes) > 0 and inserted[0] <= self._utimes[-1]:
+                # Times are inserted inside the existing ones so indices shift
+                # by the number of inserted times before them
+                index_map = np.arange(len(self._utimes)) + np.searchsorted(inserted, self._utimes)
+                self._state_inds = [index_map[inds] for inds in self._state_inds]
+                self._times_expand_index = index_map[self._times_expand_index]
+                utimes = np.insert(self._utimes, np.searchsorted(self._utimes, inserted), inserted)
+            else:
+                utimes = np.concatenate([self._utimes, inserted])
+            self._utimes = utimes
+            self.times = Time(utimes, format="datetime64", scale="utc")
+
+        state_inds = np.searchsorted(self._utimes, new_utimes)[new_inverse]
+
+        self._times_df_map = np.concatenate([
+            self._times_df_map,
+            np.full((len(df),), len(self.dfs), dtype=np.int64),
+        ])
+        self._times_expand_index = np.concatenate([self._times_expand_index, state_inds])
+
+        self.models.append(model)
+        self.dfs.append(df)
+        obs, inv_sd = self._compile_model(model, df, state_inds)
+        self._obs = np.concatenate([self._obs] + obs)
+        self._inv_sd = np.concatenate([self._inv_sd] + inv_sd)
+
+    def _simulate(self, state):
+        """Simulate all measurements of a state into the flat measurement layout"""
+        t0 = time.perf_counter()
+        states = self.state_generator.get_states(state, self.times)
+        t1 = time.perf_counter()
 
-            diffs = {}
-            for var in sim_data:
-                diffs[var] = (df[var].values - sim_data[var])
-            resids.append(diffs)
+        sim = np.empty_like(self._obs)
+        for model, dates, state_inds, slices in zip(
+            self.models, self._dates, self._state_inds, self._var_slices
+        ):
+            sim_data = model.evaluate(dates, states[:, state_inds])
+            for var, var_slice in slices.items():
+                sim[var_slice] = sim_data[var]
+
+        self.timing["propagation"] += t1 - t0
+        self.timing["models"] += time.perf_counter() - t1
+        return sim
+
+    def _simulate_batch(self, states0):
+        """Simulate all measurements of a (K, n_var) batch of states into a
+        (K, size) array, each model is evaluated once on all K states
+        """
+        states0 = np.atleast_2d(states0)
+        num = states0.shape[0]
+        t0 = time.perf_counter()
+        states = self.state_generator.get_states_batch(states0, self.times)
+        t1 = time.perf_counter()
+
+        sim = np.empty((num, self.size), dtype=np.float64)
+        for model, dates, state_inds, slices in zip(
+            self.models, self._dates, self._state_inds, self._var_slices
+        ):
+            # (K, dims, n) -> (dims, K*n) with the batch as the slowest index
+            model_states = np.moveaxis(states[:, :, state_inds], 0, 1)
+            model_states = model_states.reshape(states.shape[1], num * len(state_inds))
+            sim_data = model.evaluate(np.tile(dates, num), model_states)
+            for var, var_slice in slices.items():
+                sim[:, var_slice] = np.reshape(sim_data[var], (num, len(state_inds)))
+
+        self.timing["propagation"] += t1 - t0
+        self.timing["models"] += time.perf_counter() - t1
+        return sim
+
+    def time_rows(self):
+        """Group the flat measurement layout by measurement time.
+
+        Returns for each of the unique `times` a list of (model index, model rows,
+        flat indices) tuples, where the model rows index the measurements of the
+        model at that time and the flat indices are the positions of their
+        observations in the flat layout, ordered by the models `OUTPUT_DATA`.
+        """
+        rows = [[] for _ in range(len(self.times))]
+        for model_ind, (state_inds, slices) in enumerate(zip(self._state_inds, self._var_slices)):
+            order = np.argsort(state_inds, kind="stable")
+            times, starts = np.unique(state_inds[order], return_index=True)
+            for time_ind, model_rows in zip(times, np.split(order, starts[1:])):
+                flat = [var_slice.start + model_rows for var_slice in slices.values()]
+                rows[time_ind].append((model_ind, model_rows, np.concatenate(flat)))
+        return rows
+
+    def observations_at(self, time_ind, rows=None):
+        """The observations and their variances at the measurement time
+        `times[time_ind]`, ordered like the flat indices of `time_rows`
+        """
+        if rows is None:
+            rows = self.time_rows()[time_ind]
+        flat = np.concatenate([flat_inds for _, _, flat_inds in rows])
+        return self._obs[flat], 1.0 / self._inv_sd[flat]**2
+
+    def simulate_at(self, states0, time_ind, rows=None):
+        """Simulate the measurements at the measurement time `times[time_ind]` for a
+        (K, n_var) batch of states into a (K, m) array, ordered like `observations_at`
+        """
+        if rows is None:
+            rows = self.time_rows()[time_ind]
+        states0 = np.atleast_2d(states0)
+        num = states0.shape[0]
+        t0 = time.perf_counter()
+        states = self.state_generator.get_states_batch(states0, self.times[[time_ind]])[:, :, 0]
+        t1 = time.perf_counter()
+
+        sims = []
+        for model_ind, model_rows, _ in rows:
+            dates = self._dates[model_ind][model_rows]
+            model_states = np.repeat(states, len(model_rows), axis=0).T
+            sim_data = self.models[model_ind].evaluate(np.tile(dates, num), model_states)
+            for var in self._var_slices[model_ind]:
+                sims.append(np.reshape(sim_data[var], (num, len(model_rows))))
+
+        self.timing["propagation"] += t1 - t0
+        self.timing["models"] += time.perf_counter() - t1
+        return np.concatenate(sims, axis=1)
+
+    def residuals(self, state):
+        diffs = self._obs - self._simulate(state)
+        resids = [
+            {var: diffs[var_slice] for var, var_slice in slices.items()}
+            for slices in self._var_slices
+        ]
         return resids
 
     def logprior(self, state):
@@ -84,5 +263,23 @@ class Posterior:
     def loglikelihood(self, state):
         raise NotImplementedError("Implement this to construct a posterior")
 
+    def logprior_batch(self, states):
+        """The log prior function evaluated on a (K, n_var) batch of states"""
+        states = np.atleast_2d(states)
+        if self.prior is None:
+            return np.zeros((states.shape[0],), dtype=np.float64)
+        return np.array([self.prior(state) for state in states], dtype=np.float64)
+
+    def loglikelihood_batch(self, states):
+        """The log likelihood function evaluated on a (K, n_var) batch of states,
+        override this to vectorize the likelihood
+        """
+        states = np.atleast_2d(states)
+        return np.array([self.loglikelihood(state) for state in states], dtype=np.float64)
+
+    def logposterior_batch(self, states):
+        """The un-scaled log posterior function evaluated on a (K, n_var) batch of states"""
+        return self.logprior_batch(states) + self.loglikelihood_batch(states)
+
     def __call__(self, state):
         return self.logposterior(state)
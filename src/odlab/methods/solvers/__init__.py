@@ -1,3 +1,11 @@
 from .scipy_maximize import ScipyMaximize
+from .levenberg_marquardt import LevenbergMarquardt
 from .scam import Scam
+from .ensemble import EnsembleSampler
+from .tempering import ParallelTempering
+from .importance import ImportanceSampler
+from .sequential import SequentialFilter
+from .warm_start import WarmStartStore, propagate_record, apply_warm_start
+from .chain_sink import HDF5ChainSink
+from .telemetry import Telemetry, TqdmProgress, MetricsRecorder
 from .solvers import Solver, SOLVERS
\ No newline at end of file
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+
+"""
+Streaming storage of Markov chains to HDF5 files
+
+"""
+import json
+import logging
+from pathlib import Path
+
+import numpy as np
+import h5py
+
+from ... import statistics
+
+logger = logging.getLogger(__name__)
+
+
+class HDF5ChainSink:
+    """Stores samples of a Markov chain in a HDF5 file as they are produced.
+
+    Samples are buffered and written in chunks of `chunk_size` kept samples to the
+    resizable (n_var, steps) dataset "chain" and the log-posterior values to
+    "logpost". The first `burn_in` samples are discarded and only every `thin`
+    sample after that is kept.
+
+    The sampler state can be stored with `checkpoint` and, if `resume` is set,
+    an existing file is reopened and its last checkpoint is available through
+    `load_state`. Samples written after the last checkpoint are discarded on resume.
+
+    Streaming accumulators from `odlab.statistics`, e.g. a `RunningCovariance`, given
+    as `accumulators` are fed each chunk as it is written to monitor the chain live.
+    On resume they are first fed the samples already stored in the file.
+    """
+
+    def __init__(self, path, chunk_size=1000, thin=1, burn_in=0, resume=True, accumulators=None):
+        self.path = Path(path)
+        self.chunk_size = chunk_size
+        self.thin = thin
+        self.burn_in = burn_in
+        self.resume = resume
+        self.accumulators = [] if accumulators is None else list(accumulators)
+
+        self.file = None
+        self._buffer = None
+        self._logpost_buffer = None
+        self._buffered = 0
+
+    def open(self, n_var):
+        """Open the file for writing a chain of `n_var` variables"""
+        resume = self.resume and self.path.is_file()
+        self.file = h5py.File(self.path, "a" if resume else "w")
+
+        if "chain" not in self.file:
+            self.file.create_dataset(
+                "chain",
+                shape=(n_var, 0),
+                maxshape=(n_var, None),
+                chunks=(n_var, self.chunk_size),
+                dtype=np.float64,
+            )
+            self.file.create_dataset(
+                "logpost",
+                shape=(0,),
+                maxshape=(None,),
+                chunks=(self.chunk_size,),
+                dtype=np.float64,
+            )
+            self.file.attrs["thin"] = self.thin
+            self.file.attrs["burn_in"] = self.burn_in
+        elif self.chain.shape[0] != n_var:
+            raise ValueError(
+                f"Stored chain has {self.chain.shape[0]} variables, not {n_var}"
+            )
+        else:
+            stored = self.file["state"].attrs["stored"] if "state" in self.file else 0
+            self._resize(stored)
+            statistics.feed_blocks(self.chain, self.accumulators, block_size=self.chunk_size)
+
+        self._buffer = np.empty((n_var, self.chunk_size), dtype=np.float64)
+        self._logpost_buffer = np.empty((self.chunk_size,), dtype=np.float64)
+        self._buffered = 0
+
+    def _resize(self, size):
+        self.file["chain"].resize(size, axis=1)
+        self.file["logpost"].resize(size, axis=0)
+
+    @property
+    def chain(self):
+        return self.file["chain"]
+
+    @property
+    def logpost(self):
+        return self.file["logpost"]
+
+    @property
+    def stored(self):
+        """Number of kept samples, including buffered ones"""
+        return self.chain.shape[1] + self._buffered
+
+    def append(self, sample, logpost, index):
+        """Append the sample with the given chain `index` if it is kept"""
+        if index < self.burn_in or (index - self.burn_in) % self.thin != 0:
+            return
+
+        self._buffer[:, self._buffered] = sample
+        self._logpost_buffer[self._buffered] = logpost
+        self._buffered += 1
+
+        if self._buffered == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Write all buffered samples to the file"""
+        if self._buffered == 0:
+            return
+        size = self.chain.shape[1]
+        self._resize(size + self._buffered)
+        self.chain[:, size:] = self._buffer[:, :self._buffered]
+        self.logpost[size:] = self._logpost_buffer[:self._buffered]
+        for accumulator in self.accumulators:
+            accumulator.update_chunk(self._buffer[:, :self._buffered])
+        self._buffered = 0
+        self.file.flush()
+
+    def checkpoint(self, state):
+        """Flush all samples and store the sampler state. Arrays are stored as
+        datasets and all other values as JSON attributes.
+        """
+        self.flush()
+        if "state" in self.file:
+            del self.file["state"]
+        grp = self.file.create_group("state")
+        for key, value in state.items():
+            if isinstance(value, np.ndarray):
+                grp.create_dataset(key, data=value)
+            else:
+                grp.attrs[key] = json.dumps(value)
+        grp.attrs["stored"] = self.chain.shape[1]
+        self.file.flush()
+        logger.debug(f"Checkpoint with {self.chain.shape[1]} samples to {self.path}")
+
+    def load_state(self):
+        """Load the last stored sampler state, returns None if there is none"""
+        if "state" not in self.file:
+            return None
+        grp = self.file["state"]
+        state = {key: grp[key][()] for key in grp}
+        for key, value in grp.attrs.items():
+            if key != "stored":
+                state[key] = json.loads(value)
+        return state
+
+    def close(self):
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+
+"""
+
+"""
+import logging
+
+import numpy as np
+
+from .solvers import Solver, register_solver
+from .parallel import comm, parallel_map, posterior_executor, worker_posterior
+
+logger = logging.getLogger(__name__)
+
+
+def _logposterior_chunk(args):
+    posterior, states = args
+    return posterior.logposterior_batch(states)
+
+
+def _worker_logposterior_chunk(states):
+    return worker_posterior().logposterior_batch(states)
+
+
+@register_solver("mcmc_ensemble")
+class EnsembleSampler(Solver):
+    """Affine-invariant ensemble sampling of the posterior using the stretch move [1].
+
+    The walkers are split into two halves that are updated in turn, all proposals
+    of one half are evaluated together, either as one batch through
+    `Posterior.logposterior_batch` or split into chunks over MPI ranks or
+    `processes` local processes. The local processes receive the posterior once
+    when they start and afterwards only the proposed states.
+
+    [1] Goodman, J., Weare, J. (2010). Ensemble samplers with affine invariance.
+        Communications in Applied Mathematics and Computational Science, 5(1), 65-80.
+    """
+
+    OPTIONS = {
+        "walkers": None,
+        "stretch": 2.0,
+        "tune": 1000,
+        "start_std": None,
+        "vectorize": True,
+        "processes": None,
+        "progress_bar": True,
+    }
+
+    def _evaluate(self, posterior, states, executor):
+        if comm.size > 1 or executor is not None:
+            workers = comm.size if comm.size > 1 else self.options["processes"]
+            chunks = np.array_split(states, min(workers, len(states)), axis=0)
+            if executor is not None:
+                # The workers already hold the posterior, only the states are sent
+                results = parallel_map(_worker_logposterior_chunk, chunks, executor=executor)
+            else:
+                results = parallel_map(
+                    _logposterior_chunk, [(posterior, chunk) for chunk in chunks],
+                )
+            return np.concatenate(results)
+        elif self.options["vectorize"]:
+            return posterior.logposterior_batch(states)
+        else:
+            return np.array([posterior.logposterior(state) for state in states])
+
+    def run(self, posterior, start, steps, seed=None):
+        """Sample the posterior with an ensemble of walkers.
+
+        The `start` is either a (walkers, n_var) matrix of walker start states or
+        one (n_var,) state around which the walkers are initialized using the
+        `start_std` standard deviations.
+
+        Returns the (walkers, n_var, steps) walker chains after tuning.
+        """
+        if comm.size > 1 and seed is None:
+            seed = comm.bcast(np.random.SeedSequence().entropy, root=0)
+        rng = np.random.default_rng(seed)
+
+        start = np.asarray(start, dtype=np.float64)
+        if start.ndim == 1:
+            n_var = len(start)
+            walkers = self.options["walkers"]
+            if walkers is None:
+                walkers = 4 * n_var
+            if self.options["start_std"] is None:
+                raise ValueError("A single start state needs the 'start_std' option")
+            xnow = start[None, :] + rng.normal(size=(walkers, n_var)) * self.options["start_std"]
+        else:
+            walkers, n_var = start.shape
+            xnow = start.copy()
+
+        if walkers % 2 != 0 or walkers < 2 * n_var:
+            raise ValueError(
+                f"Number of walkers must be even and at least {2 * n_var}, not {walkers}"
+            )
+
+        tune = self.options["tune"]
+        run_steps = tune + steps
+        chain = np.empty((walkers, n_var, steps), dtype=np.float64)
+
+        a = self.options["stretch"]
+        halves = [np.arange(0, walkers // 2), np.arange(walkers // 2, walkers)]
+        accepted = 0
+
+        executor = None
+        if comm.size == 1 and self.options["processes"] is not None:
+            executor = posterior_executor(posterior, self.options["processes"])
+
+        try:
+            logpost = self._evaluate(posterior, xnow, executor)
+
+            telemetry = self.telemetry(
+                posterior, total=run_steps, description="Sampling max log-posterior",
+            )
+
+            for ind in range(run_steps):
+                step_accepted = 0
+                for half in range(2):
+                    active = halves[half]
+                    other = halves[1 - half]
+                    num = len(active)
+
+                    # Sample z from g(z) ~ 1/sqrt(z) on [1/a, a]
+                    z = ((a - 1.0) * rng.random(num) + 1.0) ** 2 / a
+                    partners = other[rng.integers(len(other), size=num)]
+                    xtry = xnow[partners, :] + z[:, None] * (xnow[active, :] - xnow[partners, :])
+
+                    logpost_try = self._evaluate(posterior, xtry, executor)
+                    log_ratio = (n_var - 1) * np.log(z) + logpost_try - logpost[active]
+                    accept = np.log(rng.random(num)) < log_ratio
+
+                    xnow[active[accept], :] = xtry[accept, :]
+                    logpost[active[accept]] = logpost_try[accept]
+                    step_accepted += np.sum(accept)
+
+                if ind >= tune:
+                    chain[:, :, ind - tune] = xnow
+                    accepted += step_accepted
+
+                telemetry.record(
+                    np.max(logpost),
+                    evaluations=walkers,
+                    accepted=int(step_accepted),
+                    tries=walkers,
+                )
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        telemetry.close()
+
+        if steps > 0:
+            logger.info(f"Acceptance fraction: {accepted / (walkers * steps):.3f}")
+
+        return chain
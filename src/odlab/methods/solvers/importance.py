@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+
+"""
+
+"""
+import logging
+
+import numpy as np
+import scipy.special
+
+from .solvers import Solver, register_solver
+from .parallel import comm, parallel_map, posterior_executor
+from .ensemble import _logposterior_chunk, _worker_logposterior_chunk
+
+logger = logging.getLogger(__name__)
+
+
+@register_solver("importance_sampling")
+class ImportanceSampler(Solver):
+    """Importance sampling of the posterior using a Gaussian Laplace proposal.
+
+    The proposal is centred on the start state, which should be the maximum a
+    posteriori state, with the covariance given by the `cov` option or else the
+    linearized covariance estimate of the posterior at the start state, scaled by
+    `proposal_scale`. All samples are independent, so they are evaluated in chunks
+    of `chunk_size` through `Posterior.logposterior_batch`, distributed over MPI
+    ranks or `processes` local processes if available. The local processes receive
+    the posterior once when they start.
+    """
+
+    OPTIONS = {
+        "cov": None,
+        "jacobian_delta": 0.1,
+        "proposal_scale": 1.0,
+        "chunk_size": 1000,
+        "processes": None,
+        "progress_bar": True,
+    }
+
+    def run(self, posterior, start, samples, seed=None):
+        """Draw `samples` states from the proposal and weight them by the posterior.
+
+        Returns the (n_var, samples) states and a dict with the self-normalized
+        importance `weights`, the weighted `mean` and `cov`, the effective sample
+        size `ess`, the `log_evidence` estimate of the (unnormalized) posterior and
+        the `proposal_mean` and `proposal_cov`.
+        """
+        if comm.size > 1 and seed is None:
+            seed = comm.bcast(np.random.SeedSequence().entropy, root=0)
+        rng = np.random.default_rng(seed)
+
+        mean = np.array(start, dtype=np.float64)
+        n_var = len(mean)
+
+        cov = self.options["cov"]
+        if cov is None:
+            deltas = self.options["jacobian_delta"]
+            if not isinstance(deltas, np.ndarray):
+                deltas = np.ones((n_var,), dtype=np.float64) * deltas
+            cov = posterior.linear_covariance_estimate(mean, deltas, prior_cov_inv=None)
+        cov = np.asarray(cov, dtype=np.float64) * self.options["proposal_scale"]**2
+
+        L = np.linalg.cholesky(cov)
+        z = rng.standard_normal(size=(samples, n_var))
+        states = mean[None, :] + z @ L.T
+        log_norm_q = np.sum(np.log(np.diag(L))) + 0.5 * n_var * np.log(2 * np.pi)
+        logq = -0.5 * np.sum(z**2, axis=1) - log_norm_q
+
+        chunks = np.array_split(
+            states, max(1, int(np.ceil(samples / self.options["chunk_size"]))), axis=0,
+        )
+        telemetry = self.telemetry(posterior, total=len(chunks), description="Max log-posterior")
+
+        if comm.size > 1:
+            results = parallel_map(_logposterior_chunk, [(posterior, chunk) for chunk in chunks])
+        elif self.options["processes"] is not None:
+            # The workers receive the posterior once, only the states are sent
+            with posterior_executor(posterior, self.options["processes"]) as executor:
+                results = parallel_map(_worker_logposterior_chunk, chunks, executor=executor)
+        else:
+            results = None
+
+        if results is not None:
+            for result in results:
+                telemetry.record(np.max(result), evaluations=len(result))
+        else:
+            results = []
+            for chunk in chunks:
+                results.append(posterior.logposterior_batch(chunk))
+                telemetry.record(np.max(results[-1]), evaluations=len(chunk))
+        logpost = np.concatenate(results)
+        telemetry.close()
+
+        log_weights = logpost - logq
+        log_norm = scipy.special.logsumexp(log_weights)
+        weights = np.exp(log_weights - log_norm)
+
+        est_mean = weights @ states
+        dx = states - est_mean[None, :]
+        est_cov = (dx * weights[:, None]).T @ dx / (1.0 - np.sum(weights**2))
+        ess = 1.0 / np.sum(weights**2)
+        logger.info(f"Importance sampling effective sample size: {ess:.1f} of {samples}")
+
+        stats = dict(
+            weights=weights,
+            mean=est_mean,
+            cov=est_cov,
+            ess=ess,
+            log_evidence=log_norm - np.log(samples),
+            proposal_mean=mean,
+            proposal_cov=cov,
+        )
+        return states.T, stats
@@ -0,0 +1,133 @@
+import logging
+
+import scipy.optimize as optimize
+import numpy as np
+
+from .solvers import Solver, register_solver
+from ..posterior.gaussian_error import invert_information
+
+logger = logging.getLogger(__name__)
+
+
+@register_solver("levenberg_marquardt")
+class LevenbergMarquardt(Solver):
+    """Levenberg-Marquardt least squares maximization of a Gaussian error posterior,
+    uses the whitened residuals and the numerical Jacobean of the posterior.
+
+    The damping is updated according to the gain ratio between the actual and
+    the predicted reduction of the cost [1]. The initial `damping` is relative to
+    the diagonal of the normal matrix and setting it to zero gives undamped
+    Gauss-Newton iterations, which fall back to damping if a step is rejected.
+
+    The prior of the posterior is not included in the least squares problem.
+    The returned `fun` is the cost, i.e. the negative log likelihood, and `cov`
+    is the linearized covariance at the solution.
+
+    [1] Madsen, K., Nielsen, H. B., Tingleff, O. (2004). Methods for non-linear
+        least squares problems.
+    """
+
+    OPTIONS = {
+        "maxiter": 100,
+        "jacobian_delta": 0.1,
+        "central_difference": False,
+        "damping": 1e-3,
+        "marquardt_scaling": True,
+        "ftol": 1e-6,
+        "xtol": 1e-8,
+        "gtol": 1e-8,
+        "progress_bar": True,
+    }
+
+    def run(self, posterior, start):
+        maxiter = self.options["maxiter"]
+        central = self.options["central_difference"]
+        deltas = self.options["jacobian_delta"]
+
+        if posterior.prior is not None:
+            logger.warning(f"{type(self).__name__} does not include the posterior prior")
+
+        x = np.array(start, dtype=np.float64)
+        resid, J = posterior.whitened_jacobian_estimate(x, deltas, central=central)
+        cost = 0.5 * np.dot(resid, resid)
+        nfev = 1
+        njev = 1
+
+        A = J.T @ J
+        g = J.T @ resid
+        if self.options["marquardt_scaling"]:
+            D = np.diag(np.diag(A))
+            mu_scale = 1.0
+        else:
+            D = np.eye(len(x), dtype=np.float64)
+            mu_scale = np.max(np.diag(A))
+        mu = self.options["damping"] * mu_scale
+        nu = 2.0
+
+        telemetry = self.telemetry(posterior, total=maxiter, description="Log likelihood")
+
+        nit = 0
+        status = 0
+        message = "Maximum number of iterations reached"
+        for nit in range(1, maxiter + 1):
+            if np.max(np.abs(g)) <= self.options["gtol"]:
+                status, message = 1, "Gradient below tolerance"
+                break
+
+            dx = np.linalg.solve(A + mu * D, g)
+            xtol = self.options["xtol"]
+            if np.linalg.norm(dx) <= xtol * (np.linalg.norm(x) + xtol):
+                status, message = 2, "Step size below tolerance"
+                break
+
+            x_try = x + dx
+            resid_try = posterior.whitened_residuals(x_try)
+            cost_try = 0.5 * np.dot(resid_try, resid_try)
+            nfev += 1
+            telemetry.record(-cost_try, accepted=int(cost_try < cost), tries=1)
+
+            predicted = 0.5 * np.dot(dx, mu * D @ dx + g)
+            rho = (cost - cost_try) / predicted if predicted > 0 else -1.0
+
+            if rho > 0:
+                reduction = cost - cost_try
+                x = x_try
+                cost = cost_try
+
+                resid, J = posterior.whitened_jacobian_estimate(x, deltas, central=central)
+                njev += 1
+                telemetry.record(
+                    -cost, evaluations=(2 if central else 1) * len(x) + 1, iterations=0,
+                )
+                A = J.T @ J
+                g = J.T @ resid
+                if self.options["marquardt_scaling"]:
+                    D = np.maximum(D, np.diag(np.diag(A)))
+                mu *= max(1.0 / 3.0, 1.0 - (2.0 * rho - 1.0) ** 3)
+                nu = 2.0
+
+                if reduction <= self.options["ftol"] * cost:
+                    status, message = 3, "Cost reduction below tolerance"
+                    break
+            else:
+                if mu > 0:
+                    mu *= nu
+                else:
+                    mu = 1e-3 * mu_scale
+                nu *= 2.0
+
+        telemetry.close()
+
+        result = optimize.OptimizeResult(
+            x=x,
+            fun=cost,
+            jac=J,
+            cov=invert_information(A),
+            nit=nit,
+            nfev=nfev,
+            njev=njev,
+            status=status,
+            success=status > 0,
+            message=message,
+        )
+        return result
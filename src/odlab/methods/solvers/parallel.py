@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+"""
+Distribution of independent solver work over MPI ranks or a local process pool
+
+"""
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+try:
+    from mpi4py import MPI
+
+    comm = MPI.COMM_WORLD
+except ImportError:
+
+    class COMM_WORLD:
+        size = 1
+        rank = 0
+
+    comm = COMM_WORLD()
+
+_worker_posterior = None
+
+
+def _set_worker_posterior(posterior):
+    global _worker_posterior
+    _worker_posterior = posterior
+
+
+def worker_posterior():
+    """The posterior of the current `posterior_executor` worker process"""
+    return _worker_posterior
+
+
+def posterior_executor(posterior, processes):
+    """Local process pool where the posterior is sent once to each worker when it
+    starts, functions mapped over the pool access it through `worker_posterior`
+    so that only the work items are sent for each task.
+    """
+    return ProcessPoolExecutor(
+        max_workers=processes,
+        initializer=_set_worker_posterior,
+        initargs=(posterior,),
+    )
+
+
+def parallel_map(func, items, processes=None, executor=None):
+    """Map a function over a list of items.
+
+    When running under MPI with more than one rank the items are distributed
+    round-robin across the ranks and the results are gathered on all ranks.
+    Otherwise the given `executor` is used, or a local process pool if `processes`
+    is larger than one, in which case the function and items need to be picklable.
+    """
+    items = list(items)
+
+    if comm.size > 1:
+        local = [
+            (ind, func(items[ind]))
+            for ind in range(comm.rank, len(items), comm.size)
+        ]
+        results = [None] * len(items)
+        for part in comm.allgather(local):
+            for ind, result in part:
+                results[ind] = result
+        return results
+
+    if executor is not None:
+        return list(executor.map(func, items))
+
+    if processes is not None and processes > 1:
+        logger.debug(f"Mapping {len(items)} items over {processes} processes")
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            return list(executor.map(func, items))
+
+    return [func(item) for item in items]
@@ -3,22 +3,20 @@
 """
 
 """
-from tqdm import tqdm
-import numpy as np
+import logging
 
-try:
-    from mpi4py import MPI
+import numpy as np
 
-    comm = MPI.COMM_WORLD
-except ImportError:
+from .solvers import Solver, register_solver
+from .parallel import comm, parallel_map
+from ... import statistics
 
-    class COMM_WORLD:
-        size = 1
-        rank = 0
+logger = logging.getLogger(__name__)
 
-    comm = COMM_WORLD()
 
-from .solvers import Solver, register_solver
+def _run_chain(args):
+    solver, posterior, start, steps, seed = args
+    return solver.run(posterior, start, steps, seed=seed)
 
 
 @register_solver("mcmc_scam")
@@ -26,6 +24,23 @@ class Scam(Solver):
     """Markov Chain Monte Carlo sampling of the posterior,
     assuming all measurement errors are Gaussian (thus the log likelihood
     becomes a least squares).
+
+    Each step moves along one axis of the proposal. With the "normal" proposal the
+    axes are the variables, with "LinSigma" they are the eigen-axes of the linearized
+    posterior covariance and with "adaptive" they are the eigen-axes of the running
+    covariance of the chain, refreshed every `proposal_adapt_interval` steps.
+    A `proposal_cov` option replaces the initial proposal, e.g. to continue from
+    the `tuning` of a previous run which holds the final step sizes and proposal
+    covariance.
+
+    With `delayed_acceptance` set, proposals are first screened using the linearized
+    log posterior from `GaussianError.linearized_logposterior` and the posterior is
+    only evaluated for proposals passing the first stage. The second stage corrects
+    for the surrogate so the chain still targets the posterior [1]. The surrogate is
+    rebuilt around the current state every `surrogate_interval` steps.
+
+    [1] Christen, J. A., Fox, C. (2005). Markov chain Monte Carlo using an
+        approximation. Journal of Computational and Graphical Statistics, 14(4), 795-810.
     """
 
     OPTIONS = {
@@ -37,83 +52,196 @@ class Scam(Solver):
         "proposal": "normal",
         "jacobian_delta": 0.1,
         "progress_bar": True,
+        "rng_block_size": 4096,
+        "processes": None,
+        "checkpoint_interval": 10000,
+        "adaptive_scale": 2.38,
+        "delayed_acceptance": False,
+        "surrogate_interval": 10000,
+        "proposal_cov": None,
     }
 
     def __init__(self, base_step_size, **kwargs):
         self.base_step_size = base_step_size
         super().__init__(**kwargs)
 
-    def run(self, posterior, start, steps, seed=None):
-        if seed is not None:
-            seed_state = np.random.seed()
-            np.random.seed(seed)
-        xnow = np.copy(start)
-        step = np.copy(self.base_step_size)
-
-        n_var = len(start)
-
-        run_steps = self.options["tune"] + steps
-        chain = np.empty((n_var, run_steps), dtype=np.float64)
+    def run(self, posterior, start, steps, seed=None, sink=None):
+        """Sample the posterior starting from `start`. The `seed` can be anything
+        accepted by `numpy.random.default_rng`, e.g. an integer, a
+        `numpy.random.SeedSequence` or a `numpy.random.Generator`.
 
-        logpost = posterior(xnow)
+        If a `sink`, e.g. a `HDF5ChainSink`, is given the samples after tuning are
+        streamed to it instead of kept in memory, the sampler state is checkpointed
+        to it every `checkpoint_interval` steps and the sink is returned. If the sink
+        contains a checkpoint, sampling is resumed from it.
+        """
+        rng = np.random.default_rng(seed)
+        block_size = self.options["rng_block_size"]
 
-        accept = np.zeros((n_var,), dtype=np.float64)
-        tries = np.zeros((n_var,), dtype=np.float64)
-
-        if self.options["proposal"] in ["normal", "adaptive"]:
-            proposal_mu = np.zeros((n_var,), dtype=np.float64)
-            proposal_cov = np.eye(n_var, dtype=np.float64)
-            proposal_axis = np.eye(n_var, dtype=np.float64)
+        n_var = len(start)
 
-        elif self.options["proposal"] == "LinSigma":
-            deltas = self.options["jacobian_delta"]
-            if not isinstance(deltas, np.ndarray):
-                deltas = np.ones((n_var,), dtype=np.float64) * deltas
+        tune = self.options["tune"]
+        run_steps = tune + steps
+
+        delayed = self.options["delayed_acceptance"]
+        deltas = self.options["jacobian_delta"]
+        if not isinstance(deltas, np.ndarray):
+            deltas = np.ones((n_var,), dtype=np.float64) * deltas
+
+        def draw_block():
+            rng_state = rng.bit_generator.state
+            return (
+                rng_state,
+                rng.integers(n_var, size=block_size),
+                rng.standard_normal(size=block_size),
+                np.log(rng.random(size=block_size)),
+                np.log(rng.random(size=block_size)) if delayed else None,
+            )
 
-            Sigma_orb = posterior.linear_covariance_estimate(start, deltas, prior_cov_inv=None)
+        adaptive = self.options["proposal"] == "adaptive"
+        running = statistics.RunningCovariance(n_var)
+        adapted = False
 
-            proposal_mu = np.zeros((n_var,), dtype=np.float64)
-            eigs, proposal_axis = np.linalg.eig(Sigma_orb)
-            proposal_cov = np.diag(eigs)
+        saved = None
+        if sink is None:
+            chain = np.empty((n_var, run_steps), dtype=np.float64)
         else:
-            raise ValueError(
-                f'proposal option "{self.options["proposal"]}"\
-                not recognized'
+            sink.open(n_var)
+            saved = sink.load_state()
+
+        if saved is None:
+            ind0 = 0
+            xnow = np.copy(start)
+            step = np.copy(self.base_step_size)
+            logpost = posterior(xnow)
+
+            accept = np.zeros((n_var,), dtype=np.float64)
+            tries = np.zeros((n_var,), dtype=np.float64)
+
+            # Only one proposal axis is used each step so the proposal factorization
+            # is kept as the standard deviation along each eigen-axis
+            if self.options["proposal_cov"] is not None:
+                eigs, proposal_axis = np.linalg.eigh(self.options["proposal_cov"])
+                proposal_std = np.sqrt(eigs)
+                adapted = True
+
+            elif self.options["proposal"] in ["normal", "adaptive"]:
+                proposal_std = np.ones((n_var,), dtype=np.float64)
+                proposal_axis = np.eye(n_var, dtype=np.float64)
+
+            elif self.options["proposal"] == "LinSigma":
+                Sigma_orb = posterior.linear_covariance_estimate(start, deltas, prior_cov_inv=None)
+
+                eigs, proposal_axis = np.linalg.eigh(Sigma_orb)
+                proposal_std = np.sqrt(eigs)
+            else:
+                raise ValueError(
+                    f'proposal option "{self.options["proposal"]}"\
+                    not recognized'
+                )
+            surrogate_ref = np.copy(xnow)
+        else:
+            ind0 = saved["index"]
+            xnow = saved["x"]
+            step = saved["step"]
+            logpost = saved["logpost"]
+            accept = saved["accept"]
+            tries = saved["tries"]
+            proposal_std = saved["proposal_std"]
+            proposal_axis = saved["proposal_axis"]
+            surrogate_ref = saved["surrogate_ref"]
+            if adaptive:
+                running.count = saved["running_count"]
+                running.mean = saved["running_mean"]
+                running.scatter = saved["running_scatter"]
+                adapted = saved["adapted"]
+
+            rng.bit_generator.state = saved["rng_state"]
+            if ind0 % block_size != 0:
+                block_rng_state, block_pi, block_normal, block_alpha, block_alpha2 = draw_block()
+            logger.info(f"Resuming sampling from step {ind0}")
+
+        def checkpoint(index):
+            if index % block_size == 0:
+                rng_state = rng.bit_generator.state
+            else:
+                rng_state = block_rng_state
+            state = dict(
+                index=index,
+                x=xnow,
+                logpost=float(logpost),
+                step=step,
+                accept=accept,
+                tries=tries,
+                proposal_std=proposal_std,
+                proposal_axis=proposal_axis,
+                rng_state=rng_state,
+                surrogate_ref=surrogate_ref,
             )
-
-        if self.options["progress_bar"]:
-            pbar = tqdm(position=comm.rank, total=run_steps)
-
-        for ind in range(run_steps):
-            if self.options["progress_bar"]:
-                pbar.update(1)
-                pbar.set_description("Sampling log-posterior = {:<10.3f} ".format(logpost))
-
-            xtry = np.copy(xnow)
-
-            pi = int(np.floor(np.random.rand(1) * n_var))
-
-            proposal0 = np.random.multivariate_normal(proposal_mu, proposal_cov)
-            proposal = proposal0[pi] * proposal_axis[:, pi]
-
-            xtry += proposal * step[pi]
-
-            logpost_try = posterior(xtry)
-            alpha = np.log(np.random.rand(1))
-
-            if logpost_try > logpost:
-                _accept = True
-            elif (logpost_try - alpha) > logpost:
-                _accept = True
+            if adaptive:
+                state.update(dict(
+                    running_count=running.count,
+                    running_mean=running.mean,
+                    running_scatter=running.scatter,
+                    adapted=adapted,
+                ))
+            sink.checkpoint(state)
+
+        if delayed:
+            surrogate = posterior.linearized_logposterior(surrogate_ref, deltas)
+            surrogate_now = surrogate(xnow)
+
+        telemetry = self.telemetry(
+            posterior, total=run_steps, initial=ind0, description="Sampling log-posterior",
+        )
+
+        for ind in range(ind0, run_steps):
+            block_ind = ind % block_size
+            if block_ind == 0:
+                block_rng_state, block_pi, block_normal, block_alpha, block_alpha2 = draw_block()
+
+            pi = block_pi[block_ind]
+            proposal = block_normal[block_ind] * proposal_std[pi] * step[pi]
+            proposal = proposal * proposal_axis[:, pi]
+            xtry = xnow + proposal
+
+            alpha = block_alpha[block_ind]
+
+            if delayed:
+                # Screen with the surrogate and correct for it in the second stage
+                surrogate_try = surrogate(xtry)
+                evaluated = surrogate_try - surrogate_now > alpha
+                if evaluated:
+                    logpost_try = posterior(xtry)
+                    log_ratio = (logpost_try - logpost) - (surrogate_try - surrogate_now)
+                    _accept = log_ratio > block_alpha2[block_ind]
+                else:
+                    _accept = False
             else:
-                _accept = False
+                logpost_try = posterior(xtry)
+                evaluated = True
+
+                if logpost_try > logpost:
+                    _accept = True
+                elif (logpost_try - alpha) > logpost:
+                    _accept = True
+                else:
+                    _accept = False
 
             tries[pi] += 1.0
+            telemetry.record(
+                logpost_try if _accept else logpost,
+                evaluations=int(evaluated),
+                accepted=int(_accept),
+                tries=1,
+            )
 
             if _accept:
                 logpost = logpost_try
                 xnow = xtry
                 accept[pi] += 1.0
+                if delayed:
+                    surrogate_now = surrogate_try
 
             ad_inv = self.options["adapt_interval"]
             cov_ad_inv = self.options["proposal_adapt_interval"]
@@ -131,17 +259,85 @@ class Scam(Solver):
                     accept[var_ind] = 0.0
                     tries[var_ind] = 0.0
 
-            if (ind % cov_ad_inv == 0 and ind > 0 and self.kwargs["proposal"] == "adaptive"):
-                _data = chain[var_ind, :ind]
-                _proposal_cov = np.corrcoef(_data)
-
-                if not np.any(np.isnan(_proposal_cov)):
-                    eigs, proposal_axis = np.linalg.eig(_proposal_cov)
-                    proposal_cov = np.diag(eigs)
-
-            chain[:, ind] = xnow
-
-        if seed is not None:
-            np.random.seed(seed_state)
+            if adaptive:
+                running.update(xnow)
+
+                if ind % cov_ad_inv == 0 and ind > 0 and running.count > n_var:
+                    eigs, axis = np.linalg.eigh(running.covariance)
+                    if np.all(eigs > 0):
+                        proposal_axis = axis
+                        proposal_std = np.sqrt(eigs)
+                        # The proposal now carries the scale of the posterior so the
+                        # step sizes become relative to the eigen-axis deviations
+                        if not adapted:
+                            step = np.full((n_var,), self.options["adaptive_scale"])
+                            adapted = True
+
+            if delayed and (ind + 1) % self.options["surrogate_interval"] == 0:
+                surrogate_ref = np.copy(xnow)
+                surrogate = posterior.linearized_logposterior(surrogate_ref, deltas)
+                surrogate_now = surrogate(xnow)
+
+            if sink is None:
+                chain[:, ind] = xnow
+            else:
+                if ind >= tune:
+                    sink.append(xnow, logpost, ind - tune)
+                if (ind + 1) % self.options["checkpoint_interval"] == 0:
+                    checkpoint(ind + 1)
+
+        telemetry.close()
+        self.tuning = dict(
+            step=np.copy(step),
+            proposal_cov=(proposal_axis * proposal_std**2) @ proposal_axis.T,
+        )
+
+        if delayed and run_steps > ind0:
+            logger.info(
+                f"Posterior evaluated for {telemetry.evaluations} of {run_steps - ind0} proposals"
+            )
 
-        return chain[self.options["tune"]:]
+        if sink is not None:
+            checkpoint(run_steps)
+            return sink
+
+        return chain[:, tune:]
+
+    def run_chains(self, posterior, start, steps, chains=4, seed=None):
+        """Sample the posterior with several independent chains distributed over
+        MPI ranks or `processes` local processes. Each chain gets an independent
+        random stream spawned from a `numpy.random.SeedSequence`.
+
+        The `start` is either one (n_var,) state shared by all chains or a
+        (chains, n_var) matrix of start states.
+
+        Returns the (chains, n_var, steps) chains and a dict of convergence
+        diagnostics containing the split $\\hat{R}$ and the effective sample size.
+        """
+        start = np.asarray(start, dtype=np.float64)
+        if start.ndim == 1:
+            start = np.tile(start, (chains, 1))
+
+        seeds = np.random.SeedSequence(seed).spawn(chains)
+
+        solver = self
+        if comm.size == 1 and self.options["processes"] is not None:
+            solver = type(self)(self.base_step_size, **self.options)
+            solver.options["progress_bar"] = False
+            solver.options["callbacks"] = None
+
+        results = parallel_map(
+            _run_chain,
+            [(solver, posterior, start[ind, :], steps, seeds[ind]) for ind in range(chains)],
+            processes=self.options["processes"],
+        )
+        samples = np.stack(results, axis=0)
+
+        diagnostics = dict(
+            rhat=statistics.split_rhat(samples),
+            ess=statistics.effective_sample_size(samples),
+        )
+        logger.info(f"Split R-hat: {diagnostics['rhat']}")
+        logger.info(f"Effective sample size: {diagnostics['ess']}")
+
+        return samples, diagnostics
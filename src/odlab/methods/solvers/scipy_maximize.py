@@ -1,45 +1,54 @@
 import logging
 
-from tqdm import tqdm
 import scipy.optimize as optimize
 import numpy as np
 
 from .solvers import Solver, register_solver
+from .parallel import comm, parallel_map
 
 logger = logging.getLogger(__name__)
 
-try:
-    from mpi4py import MPI
 
-    comm = MPI.COMM_WORLD
-except ImportError:
-
-    class COMM_WORLD:
-        size = 1
-        rank = 0
-
-    comm = COMM_WORLD()
+def _run_start(args):
+    options, posterior, start = args
+    return ScipyMaximize(**options).run(posterior, start)
 
 
 @register_solver("scipy_maximize")
 class ScipyMaximize(Solver):
+    """Maximization of the posterior using `scipy.optimize.minimize`.
+
+    If `starts` is larger than one, a multi-start optimization is performed where
+    the given start state is used together with `starts - 1` start states drawn from
+    a normal distribution around it with standard deviations `start_std`, or from
+    `start_sampler(num, rng)` if given. The optimizations are distributed over MPI
+    ranks or `processes` local processes and the best optimum is returned, with all
+    the local optima sorted by posterior value in `local_optima`.
+    """
+
     OPTIONS = {
         "method": "Nelder-Mead",
         "scipy_options": {},
         "bounds": None,
         "maxiter": 3000,
         "ignore_warnings": False,
+        "progress_bar": True,
+        "starts": 1,
+        "start_std": None,
+        "start_sampler": None,
+        "processes": None,
+        "seed": None,
     }
 
     def run(self, posterior, start):
+        if self.options["starts"] > 1:
+            return self.run_multistart(posterior, start)
+
         maxiter = self.options["maxiter"]
 
         def fun(x):
             val = posterior.logposterior(x)
-
-            pbar.update(1)
-            pbar.set_description("Posterior value = {:<10.3f} ".format(val))
-
+            telemetry.record(val)
             return -val
 
         logger.info(
@@ -49,7 +58,7 @@ class ScipyMaximize(Solver):
         if self.options["ignore_warnings"]:
             np.seterr(all="ignore")
 
-        pbar = tqdm(total=maxiter, ncols=100, position=comm.rank)
+        telemetry = self.telemetry(posterior, total=maxiter, description="Posterior value")
         xhat = optimize.minimize(
             fun,
             start,
@@ -57,9 +66,54 @@ class ScipyMaximize(Solver):
             options=self.options["scipy_options"],
             bounds=self.options["bounds"],
         )
-        pbar.close()
+        telemetry.close()
 
         if self.options["ignore_warnings"]:
             np.seterr(all=None)
 
         return xhat
+
+    def sample_starts(self, start):
+        """Generate the start states of a multi-start optimization"""
+        num = self.options["starts"] - 1
+        seed = self.options["seed"]
+        if comm.size > 1 and seed is None:
+            seed = comm.bcast(np.random.SeedSequence().entropy, root=0)
+        rng = np.random.default_rng(seed)
+        start = np.asarray(start, dtype=np.float64)
+
+        if self.options["start_sampler"] is not None:
+            samples = self.options["start_sampler"](num, rng)
+        elif self.options["start_std"] is not None:
+            std = self.options["start_std"]
+            samples = start[None, :] + rng.normal(size=(num, len(start))) * std
+        else:
+            raise ValueError("Multi-start needs either a 'start_sampler' or 'start_std' option")
+
+        return np.concatenate([start[None, :], np.atleast_2d(samples)], axis=0)
+
+    def run_multistart(self, posterior, start):
+        starts = self.sample_starts(start)
+
+        options = dict(self.options)
+        options.update(dict(
+            starts=1,
+            start_sampler=None,
+            progress_bar=False,
+            callbacks=None,
+        ))
+
+        logger.info(
+            "\n{} running {} starts".format(type(self).__name__, len(starts))
+        )
+        results = parallel_map(
+            _run_start,
+            [(options, posterior, x0) for x0 in starts],
+            processes=self.options["processes"],
+        )
+        order = np.argsort([result.fun for result in results])
+
+        xhat = optimize.OptimizeResult(results[order[0]])
+        xhat.local_optima = [results[ind] for ind in order]
+        xhat.starts = starts[order, :]
+        return xhat
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+
+"""
+
+"""
+import logging
+
+import numpy as np
+import scipy.optimize as optimize
+
+from .solvers import Solver, register_solver
+
+logger = logging.getLogger(__name__)
+
+
+@register_solver("sequential_filter")
+class SequentialFilter(Solver):
+    """Sequential estimation of the epoch state, processing the measurements of
+    the posterior one measurement time at a time with an extended (`"ekf"`) or
+    unscented (`"ukf"`) Kalman filter update.
+
+    Each update only propagates the n+1 perturbed (or 2n+1 sigma point) epoch
+    states to the current measurement time as one batch, so the cost per
+    measurement does not depend on the number of already processed measurements.
+    As the state generator propagates from the epoch, the filter state is the
+    epoch state and `process_noise` is a (n, n) covariance rate [per second]
+    of a random walk of the epoch state between measurement times, accounting
+    for un-modelled dynamics.
+
+    If `smoother` is set, a Rauch-Tung-Striebel smoother is run backwards over the
+    filtered estimates. The filtered (and smoothed) estimates at each measurement
+    time are only kept if `history` or `smoother` is set.
+    """
+
+    OPTIONS = {
+        "filter": "ekf",
+        "jacobian_delta": 0.1,
+        "process_noise": None,
+        "smoother": False,
+        "history": False,
+        "alpha": 1.0,
+        "beta": 2.0,
+        "kappa": 0.0,
+        "progress_bar": True,
+    }
+
+    def _points(self, mean, cov):
+        n_var = len(mean)
+        if self.options["filter"] == "ekf":
+            deltas = np.broadcast_to(
+                np.asarray(self.options["jacobian_delta"], dtype=np.float64), (n_var,)
+            )
+            points = np.tile(mean, (n_var + 1, 1))
+            points[1 + np.arange(n_var), np.arange(n_var)] += deltas
+            return points, deltas
+        elif self.options["filter"] == "ukf":
+            alpha, beta, kappa = self.options["alpha"], self.options["beta"], self.options["kappa"]
+            lam = alpha**2 * (n_var + kappa) - n_var
+            L = np.linalg.cholesky(cov) * np.sqrt(n_var + lam)
+            points = np.concatenate([mean[None, :], mean[None, :] + L.T, mean[None, :] - L.T])
+            wm = np.full((2 * n_var + 1,), 0.5 / (n_var + lam), dtype=np.float64)
+            wc = wm.copy()
+            wm[0] = lam / (n_var + lam)
+            wc[0] = wm[0] + 1.0 - alpha**2 + beta
+            return points, (wm, wc)
+        else:
+            raise ValueError(f'filter option "{self.options["filter"]}" not recognized')
+
+    def update(self, posterior, mean, cov, time_ind, rows=None):
+        """Update an epoch state estimate with the measurements at the given
+        measurement time index of the posterior.
+
+        Returns the updated mean, covariance and the normalized innovation squared.
+        """
+        if rows is None:
+            rows = posterior.time_rows()[time_ind]
+        obs, R_diag = posterior.observations_at(time_ind, rows=rows)
+
+        points, weights = self._points(mean, cov)
+        sims = posterior.simulate_at(points, time_ind, rows=rows)
+
+        if self.options["filter"] == "ekf":
+            pred = sims[0, :]
+            H = (sims[1:, :] - pred[None, :]).T / weights[None, :]
+            PHt = cov @ H.T
+            S = H @ PHt + np.diag(R_diag)
+        else:
+            wm, wc = weights
+            pred = wm @ sims
+            dy = sims - pred[None, :]
+            PHt = ((points - mean[None, :]) * wc[:, None]).T @ dy
+            S = (dy * wc[:, None]).T @ dy + np.diag(R_diag)
+
+        innovation = obs - pred
+        S_factor = np.linalg.cholesky(S)
+        gain = np.linalg.solve(S_factor.T, np.linalg.solve(S_factor, PHt.T)).T
+        whitened = np.linalg.solve(S_factor, innovation)
+
+        mean = mean + gain @ innovation
+        cov = cov - gain @ S @ gain.T
+        cov = 0.5 * (cov + cov.T)
+
+        return mean, cov, np.dot(whitened, whitened)
+
+    def run(self, posterior, start, cov):
+        """Filter all measurements of the posterior in time order starting from the
+        epoch state `start` with the covariance `cov`.
+
+        Returns a `scipy.optimize.OptimizeResult` with the final epoch state `x`
+        and covariance `cov`, the normalized innovation squared `nis` of each
+        measurement time and, if kept, the filtered `states` and `covs` as well as
+        the `smoothed_states` and `smoothed_covs` at each measurement time.
+        """
+        mean = np.array(start, dtype=np.float64)
+        cov = np.array(cov, dtype=np.float64)
+        Q = self.options["process_noise"]
+        keep = self.options["history"] or self.options["smoother"]
+
+        rows = posterior.time_rows()
+        t = (posterior.times - posterior.times[0]).sec
+        num_times = len(rows)
+
+        nis = np.empty((num_times,), dtype=np.float64)
+        if keep:
+            states = np.empty((num_times, len(mean)), dtype=np.float64)
+            covs = np.empty((num_times, len(mean), len(mean)), dtype=np.float64)
+
+        num_points = len(mean) + 1 if self.options["filter"] == "ekf" else 2 * len(mean) + 1
+        telemetry = self.telemetry(
+            posterior, total=num_times, description="Innovation log-likelihood",
+        )
+        for time_ind in range(num_times):
+            if Q is not None and time_ind > 0:
+                cov = cov + Q * (t[time_ind] - t[time_ind - 1])
+
+            mean, cov, nis[time_ind] = self.update(
+                posterior, mean, cov, time_ind, rows=rows[time_ind],
+            )
+            if keep:
+                states[time_ind, :] = mean
+                covs[time_ind, :, :] = cov
+            telemetry.record(-0.5 * nis[time_ind], evaluations=num_points)
+        telemetry.close()
+
+        result = optimize.OptimizeResult(x=mean, cov=cov, nis=nis, times=posterior.times)
+        if keep:
+            result.states = states
+            result.covs = covs
+        if self.options["smoother"]:
+            result.smoothed_states, result.smoothed_covs = self.smooth(states, covs, t)
+
+        return result
+
+    def smooth(self, states, covs, t):
+        """Rauch-Tung-Striebel smoothing of filtered epoch state estimates, the
+        transition is the identity with the random walk `process_noise`.
+        """
+        Q = self.options["process_noise"]
+        smoothed_states = states.copy()
+        smoothed_covs = covs.copy()
+        for ind in range(len(t) - 2, -1, -1):
+            pred_cov = covs[ind, :, :]
+            if Q is not None:
+                pred_cov = pred_cov + Q * (t[ind + 1] - t[ind])
+            C = np.linalg.solve(pred_cov, covs[ind, :, :]).T
+            smoothed_states[ind, :] = states[ind, :] + C @ (
+                smoothed_states[ind + 1, :] - states[ind, :]
+            )
+            smoothed_covs[ind, :, :] = covs[ind, :, :] + C @ (
+                smoothed_covs[ind + 1, :, :] - pred_cov
+            ) @ C.T
+        return smoothed_states, smoothed_covs
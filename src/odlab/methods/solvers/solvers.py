@@ -1,6 +1,8 @@
 import logging
 from collections import OrderedDict
 
+from .telemetry import Telemetry, TqdmProgress
+
 logger = logging.getLogger(__name__)
 
 SOLVERS = OrderedDict()
@@ -20,12 +22,32 @@ def register_solver(name):
 
 
 class Solver:
+    """Base solver, the `callbacks` option is a list of functions receiving the
+    `Telemetry` metrics of a run at most every `telemetry_interval` seconds.
+    """
+
     OPTIONS = {}
+    BASE_OPTIONS = {
+        "callbacks": None,
+        "telemetry_interval": 1.0,
+    }
 
     def __init__(self, **kwargs):
         self.options = {}
+        self.options.update(self.BASE_OPTIONS)
         self.options.update(self.OPTIONS)
         self.options.update(kwargs)
 
+    def telemetry(self, posterior, total=None, initial=0, description="Best value"):
+        """Create the telemetry of a run, including a progress bar if the
+        `progress_bar` option is set.
+        """
+        callbacks = list(self.options["callbacks"] or [])
+        if self.options.get("progress_bar", False):
+            callbacks.append(TqdmProgress(total=total, initial=initial, description=description))
+        return Telemetry(
+            self, posterior, callbacks=callbacks, interval=self.options["telemetry_interval"],
+        )
+
     def run(self, posterior, **kwargs):
         raise NotImplementedError("Implement this to construct a method")
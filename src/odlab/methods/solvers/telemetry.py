@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+"""
+Rate limited progress reporting of solvers
+
+"""
+import logging
+import time
+
+import numpy as np
+from tqdm import tqdm
+
+from .parallel import comm
+
+logger = logging.getLogger(__name__)
+
+
+class Telemetry:
+    """Collects counters of a running solver and reports metrics to callbacks.
+
+    Recording is only a few counter updates, the metrics are assembled and passed
+    to each callback at most once every `interval` seconds and once when closed,
+    so the reporting cost does not scale with the number of evaluations.
+
+    The metrics dict contains the `solver` name, the number of `iterations` and
+    posterior `evaluations`, the `elapsed` time, the `evaluations_per_second`
+    since the last report, the `acceptance` ratio since the last report (if the
+    solver accepts or rejects proposals), the `best` and `last` recorded values
+    and, if the posterior keeps timing counters, the `propagation_time` and
+    `model_time` spent since the start.
+    """
+
+    def __init__(self, solver, posterior, callbacks=None, interval=1.0):
+        self.solver = solver
+        self.posterior = posterior
+        self.callbacks = [] if callbacks is None else list(callbacks)
+        self.interval = interval
+
+        self.iterations = 0
+        self.evaluations = 0
+        self.accepted = 0
+        self.tries = 0
+        self.best = -np.inf
+        self.last = np.nan
+
+        timing = getattr(posterior, "timing", None)
+        self._timing0 = None if timing is None else dict(timing)
+        self._start = time.perf_counter()
+        self._last_report = self._start
+        self._last_evaluations = 0
+        self._last_accepted = 0
+        self._last_tries = 0
+
+    def record(self, value, evaluations=1, accepted=0, tries=0, iterations=1):
+        """Record the outcome of an iteration with the current `value`"""
+        self.iterations += iterations
+        self.evaluations += evaluations
+        self.accepted += accepted
+        self.tries += tries
+        self.last = value
+        if value > self.best:
+            self.best = value
+
+        if self.callbacks and time.perf_counter() - self._last_report >= self.interval:
+            self.report()
+
+    def metrics(self):
+        now = time.perf_counter()
+        tries = self.tries - self._last_tries
+
+        metrics = dict(
+            solver=type(self.solver).__name__,
+            iterations=self.iterations,
+            evaluations=self.evaluations,
+            elapsed=now - self._start,
+            evaluations_per_second=(
+                (self.evaluations - self._last_evaluations) / max(now - self._last_report, 1e-9)
+            ),
+            acceptance=(self.accepted - self._last_accepted) / tries if tries > 0 else None,
+            best=self.best,
+            last=self.last,
+        )
+        if self._timing0 is not None:
+            timing = self.posterior.timing
+            metrics["propagation_time"] = timing["propagation"] - self._timing0["propagation"]
+            metrics["model_time"] = timing["models"] - self._timing0["models"]
+        return metrics
+
+    def report(self):
+        """Pass the current metrics to all callbacks"""
+        metrics = self.metrics()
+        for callback in self.callbacks:
+            callback(metrics)
+
+        self._last_report = time.perf_counter()
+        self._last_evaluations = self.evaluations
+        self._last_accepted = self.accepted
+        self._last_tries = self.tries
+        return metrics
+
+    def close(self):
+        """Report the final metrics and close all callbacks that can be closed"""
+        metrics = self.report()
+        for callback in self.callbacks:
+            if hasattr(callback, "close"):
+                callback.close()
+        return metrics
+
+
+class TqdmProgress:
+    """Callback showing the solver iterations in a tqdm progress bar"""
+
+    def __init__(self, total=None, initial=0, description="Best value"):
+        self.description = description
+        self.pbar = tqdm(total=total, initial=initial, ncols=100, position=comm.rank)
+
+    def __call__(self, metrics):
+        self.pbar.update(metrics["iterations"] - (self.pbar.n - self.pbar.initial))
+        self.pbar.set_description("{} = {:<10.3f} ".format(self.description, metrics["best"]))
+
+    def close(self):
+        self.pbar.close()
+
+
+class MetricsRecorder:
+    """Callback collecting all reported metrics, e.g. for batch jobs without
+    a progress bar.
+    """
+
+    def __init__(self):
+        self.history = []
+
+    def __call__(self, metrics):
+        self.history.append(metrics)
+
+    @property
+    def last(self):
+        return self.history[-1] if len(self.history) > 0 else None
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+
+"""
+
+"""
+import logging
+
+import numpy as np
+
+from .solvers import Solver, register_solver
+from .parallel import comm, parallel_map, posterior_executor, worker_posterior
+
+logger = logging.getLogger(__name__)
+
+
+def _temper_segment(posterior, xnow, logpost, beta, step, steps, rng, keep_chain):
+    """Run `steps` single-axis Metropolis steps on the posterior raised to `beta`,
+    the segment chain is only returned if `keep_chain` is set
+    """
+    n_var = len(xnow)
+
+    chain = np.empty((n_var, steps), dtype=np.float64) if keep_chain else None
+    accept = np.zeros((n_var,), dtype=np.float64)
+    tries = np.zeros((n_var,), dtype=np.float64)
+
+    pis = rng.integers(n_var, size=steps)
+    normals = rng.standard_normal(size=steps)
+    alphas = np.log(rng.random(size=steps))
+
+    for ind in range(steps):
+        pi = pis[ind]
+        xtry = xnow.copy()
+        xtry[pi] += normals[ind] * step[pi]
+
+        logpost_try = posterior(xtry)
+        tries[pi] += 1.0
+
+        if beta * (logpost_try - logpost) > alphas[ind]:
+            xnow = xtry
+            logpost = logpost_try
+            accept[pi] += 1.0
+
+        if keep_chain:
+            chain[:, ind] = xnow
+
+    return xnow, logpost, chain, accept, tries, rng
+
+
+def _posterior_segment(args):
+    return _temper_segment(*args)
+
+
+def _worker_segment(args):
+    # The posterior is held by the `posterior_executor` worker
+    return _temper_segment(worker_posterior(), *args)
+
+
+@register_solver("mcmc_tempering")
+class ParallelTempering(Solver):
+    """Parallel tempering sampling of the posterior.
+
+    A ladder of replicas sample the posterior raised to the inverse temperatures
+    $\\beta_i = 1/T_i$ with single-axis Metropolis steps. Every `swap_interval` steps
+    the replicas run in parallel, over MPI ranks or `processes` local processes,
+    and afterwards swaps of states between neighbouring temperatures are proposed,
+    alternating between even and odd pairs [1]. Only the $T = 1$ replica samples
+    the posterior, the hot replicas let it escape local modes.
+
+    The `temperatures` option is an increasing sequence starting at 1, if it is not
+    given `num_temperatures` geometrically spaced temperatures up to
+    `max_temperature` are used. The step sizes of each replica start at
+    `base_step_size` scaled by $\\sqrt{T_i}$ and are tuned like in `Scam`.
+
+    [1] Earl, D. J., Deem, M. W. (2005). Parallel tempering: Theory, applications,
+        and new perspectives. Physical Chemistry Chemical Physics, 7(23), 3910-3916.
+    """
+
+    OPTIONS = {
+        "temperatures": None,
+        "num_temperatures": 4,
+        "max_temperature": 100.0,
+        "swap_interval": 100,
+        "accept_max": 0.5,
+        "accept_min": 0.3,
+        "adapt_interval": 1000,
+        "tune": 1000,
+        "processes": None,
+        "progress_bar": True,
+    }
+
+    def __init__(self, base_step_size, **kwargs):
+        self.base_step_size = base_step_size
+        super().__init__(**kwargs)
+
+    @property
+    def temperatures(self):
+        if self.options["temperatures"] is not None:
+            temperatures = np.asarray(self.options["temperatures"], dtype=np.float64)
+            if temperatures[0] != 1.0 or np.any(np.diff(temperatures) <= 0):
+                raise ValueError("Temperatures must be increasing and start at 1")
+            return temperatures
+        return np.geomspace(
+            1.0, self.options["max_temperature"], self.options["num_temperatures"],
+        )
+
+    def _tune_steps(self, step, accept, tries):
+        tried = tries > 0
+        ratio = accept[tried] / tries[tried]
+        step[tried] = np.where(ratio > self.options["accept_max"], 2.0, 1.0) * step[tried]
+        step[tried] = np.where(ratio < self.options["accept_min"], 0.5, 1.0) * step[tried]
+        accept[:] = 0.0
+        tries[:] = 0.0
+
+    def run(self, posterior, start, steps, seed=None):
+        """Sample the posterior starting all replicas from `start`. The `seed` can be
+        anything accepted by `numpy.random.default_rng`, each replica gets an
+        independent random stream spawned from it.
+
+        Returns the (n_var, steps) chain of the $T = 1$ replica after tuning and a
+        dict of swap statistics with the `temperatures`, the number of proposed
+        `swap_tries` and accepted `swap_accepts` between each neighbouring pair and
+        their `swap_acceptance` ratio.
+        """
+        if comm.size > 1 and seed is None:
+            seed = comm.bcast(np.random.SeedSequence().entropy, root=0)
+        if isinstance(seed, np.random.SeedSequence):
+            seed_seq = seed
+        else:
+            seed_seq = np.random.SeedSequence(seed)
+
+        temperatures = self.temperatures
+        betas = 1.0 / temperatures
+        num_temps = len(temperatures)
+
+        seeds = seed_seq.spawn(num_temps + 1)
+        rng = np.random.default_rng(seeds[0])
+        replica_rngs = [np.random.default_rng(seq) for seq in seeds[1:]]
+
+        n_var = len(start)
+        tune = self.options["tune"]
+        run_steps = tune + steps
+        interval = self.options["swap_interval"]
+
+        xnow = np.tile(np.asarray(start, dtype=np.float64), (num_temps, 1))
+        logpost = np.full((num_temps,), posterior(xnow[0, :]), dtype=np.float64)
+        base_step = np.ones((n_var,), dtype=np.float64) * self.base_step_size
+        step = base_step[None, :] * np.sqrt(temperatures)[:, None]
+
+        accept = np.zeros((num_temps, n_var), dtype=np.float64)
+        tries = np.zeros((num_temps, n_var), dtype=np.float64)
+        swap_accepts = np.zeros((num_temps - 1,), dtype=np.int64)
+        swap_tries = np.zeros((num_temps - 1,), dtype=np.int64)
+
+        chain = np.empty((n_var, steps), dtype=np.float64)
+
+        executor = None
+        if comm.size == 1 and self.options["processes"] is not None:
+            executor = posterior_executor(posterior, self.options["processes"])
+
+        telemetry = self.telemetry(
+            posterior, total=run_steps, description="Sampling log-posterior",
+        )
+
+        ind = 0
+        since_adapt = 0
+        parity = 0
+        try:
+            while ind < run_steps:
+                # Segments do not cross the end of tuning to keep the step sizes
+                # fixed while collecting samples
+                end = min(ind + interval, tune if ind < tune else run_steps)
+                seg_steps = end - ind
+
+                # Only the T = 1 replica chain after tuning is kept
+                items = [
+                    (xnow[ti, :], logpost[ti], betas[ti], step[ti, :], seg_steps,
+                     replica_rngs[ti], ti == 0 and ind >= tune)
+                    for ti in range(num_temps)
+                ]
+                if executor is not None:
+                    results = parallel_map(_worker_segment, items, executor=executor)
+                else:
+                    results = parallel_map(
+                        _posterior_segment, [(posterior,) + item for item in items],
+                    )
+                acc_total = 0.0
+                for ti, (x, lp, seg_chain, acc, tri, replica_rng) in enumerate(results):
+                    xnow[ti, :] = x
+                    logpost[ti] = lp
+                    accept[ti, :] += acc
+                    acc_total += np.sum(acc)
+                    tries[ti, :] += tri
+                    replica_rngs[ti] = replica_rng
+                    if ti == 0 and ind >= tune:
+                        chain[:, (ind - tune):(end - tune)] = seg_chain
+
+                ind = end
+                since_adapt += seg_steps
+                if ind <= tune and since_adapt >= self.options["adapt_interval"]:
+                    for ti in range(num_temps):
+                        self._tune_steps(step[ti, :], accept[ti, :], tries[ti, :])
+                    since_adapt = 0
+
+                for ti in range(parity, num_temps - 1, 2):
+                    log_alpha = (betas[ti] - betas[ti + 1]) * (logpost[ti + 1] - logpost[ti])
+                    swap_tries[ti] += 1
+                    if np.log(rng.random()) < log_alpha:
+                        xnow[[ti, ti + 1], :] = xnow[[ti + 1, ti], :]
+                        logpost[[ti, ti + 1]] = logpost[[ti + 1, ti]]
+                        swap_accepts[ti] += 1
+                parity = 1 - parity
+
+                telemetry.record(
+                    logpost[0],
+                    evaluations=seg_steps * num_temps,
+                    accepted=int(np.sum(acc_total)),
+                    tries=seg_steps * num_temps,
+                    iterations=seg_steps,
+                )
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        telemetry.close()
+
+        swap_acceptance = swap_accepts / np.maximum(swap_tries, 1)
+        logger.info(f"Swap acceptance between temperatures: {swap_acceptance}")
+
+        stats = dict(
+            temperatures=temperatures,
+            swap_tries=swap_tries,
+            swap_accepts=swap_accepts,
+            swap_acceptance=swap_acceptance,
+        )
+        return chain, stats
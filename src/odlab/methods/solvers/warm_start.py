@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+
+"""
+Persistent storage of solver results used to warm start later runs
+
+"""
+import logging
+from pathlib import Path
+
+import numpy as np
+import h5py
+from astropy.time import Time, TimeDelta
+
+from .scam import Scam
+from .scipy_maximize import ScipyMaximize
+
+logger = logging.getLogger(__name__)
+
+RECORD_ARRAYS = ["state", "cov", "step", "proposal_cov"]
+
+
+class WarmStartStore:
+    """Results store in a HDF5 file keyed by object ID and epoch.
+
+    Each record holds the maximum a posteriori `state` and optionally its `cov`,
+    the sampler `step` sizes and `proposal_cov` as well as any extra attributes.
+    Records are stored in the group "<object_id>/<epoch isot>".
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    @staticmethod
+    def _epoch_key(epoch):
+        return Time(epoch, scale="utc").utc.isot
+
+    def save(self, object_id, epoch, state, cov=None, step=None, proposal_cov=None, **attrs):
+        """Store a record, replacing any existing record of the same object and epoch"""
+        key = self._epoch_key(epoch)
+        arrays = dict(state=state, cov=cov, step=step, proposal_cov=proposal_cov)
+        with h5py.File(self.path, "a") as hf:
+            obj = hf.require_group(str(object_id))
+            if key in obj:
+                del obj[key]
+            grp = obj.create_group(key)
+            for name, value in arrays.items():
+                if value is not None:
+                    grp.create_dataset(name, data=np.asarray(value, dtype=np.float64))
+            for name, value in attrs.items():
+                grp.attrs[name] = value
+        logger.debug(f"Stored warm start of {object_id} at {key}")
+
+    def save_solver(self, object_id, epoch, solver, state, cov=None, **attrs):
+        """Store a record with the tuning of a solver that has been run"""
+        tuning = getattr(solver, "tuning", {})
+        self.save(
+            object_id,
+            epoch,
+            state,
+            cov=cov,
+            step=tuning.get("step"),
+            proposal_cov=tuning.get("proposal_cov"),
+            solver=type(solver).__name__,
+            **attrs,
+        )
+
+    def epochs(self, object_id):
+        """The stored epochs of an object in increasing order"""
+        if not self.path.is_file():
+            return Time([], format="isot", scale="utc")
+        with h5py.File(self.path, "r") as hf:
+            if str(object_id) not in hf:
+                return Time([], format="isot", scale="utc")
+            keys = sorted(hf[str(object_id)].keys())
+        return Time(keys, format="isot", scale="utc")
+
+    def load(self, object_id, epoch=None):
+        """Load the record of an object closest to `epoch`, or the latest if not given.
+        Returns None if the object has no records.
+        """
+        epochs = self.epochs(object_id)
+        if len(epochs) == 0:
+            return None
+        if epoch is None:
+            ind = len(epochs) - 1
+        else:
+            ind = np.argmin(np.abs((epochs - Time(epoch, scale="utc")).sec))
+        key = epochs[ind].isot
+
+        with h5py.File(self.path, "r") as hf:
+            grp = hf[str(object_id)][key]
+            record = {name: grp[name][()] for name in RECORD_ARRAYS if name in grp}
+            record.update(dict(grp.attrs.items()))
+        record["epoch"] = epochs[ind]
+        return record
+
+
+def propagate_record(record, epoch, state_generator, deltas):
+    """Propagate a stored record to a new epoch using a state generator with its
+    epoch at the record epoch. The covariances are propagated with the numerical
+    Jacobean of the state transition, the step sizes are kept.
+
+    The record is in the input frame of the state generator, so the propagated
+    states are converted back from its output frame with
+    `StateGenerator.to_input_frame`, which fails for generators that cannot.
+    """
+    epoch = Time(epoch, scale="utc")
+    state = record["state"]
+    n_var = len(state)
+    deltas = np.broadcast_to(np.asarray(deltas, dtype=np.float64), (n_var,))
+
+    states0 = np.tile(state, (n_var + 1, 1))
+    states0[1 + np.arange(n_var), np.arange(n_var)] += deltas
+    states = state_generator.get_states_batch(states0, Time([epoch]))[:, :, 0]
+    times = epoch + TimeDelta(np.zeros((n_var + 1,)), format="sec")
+    states = state_generator.to_input_frame(states.T, times).T
+    phi = (states[1:, :] - states[None, 0, :]).T / deltas[None, :]
+
+    propagated = dict(record)
+    propagated["state"] = states[0, :]
+    propagated["epoch"] = epoch
+    for name in ["cov", "proposal_cov"]:
+        if name in record:
+            propagated[name] = phi @ record[name] @ phi.T
+    return propagated
+
+
+def apply_warm_start(solver, record):
+    """Configure a solver from a (propagated) record and return the start state.
+
+    A `Scam` solver gets the stored step sizes and proposal covariance, or the
+    standard deviations of the covariance as step sizes. A Nelder-Mead
+    `ScipyMaximize` gets an initial simplex along the principal axes of the
+    covariance.
+    """
+    if isinstance(solver, Scam):
+        if "proposal_cov" in record and "step" in record:
+            solver.base_step_size = np.copy(record["step"])
+            solver.options["proposal_cov"] = record["proposal_cov"]
+        elif "cov" in record:
+            solver.base_step_size = np.sqrt(np.diag(record["cov"]))
+    elif isinstance(solver, ScipyMaximize):
+        if "cov" in record and solver.options["method"] == "Nelder-Mead":
+            eigs, axis = np.linalg.eigh(record["cov"])
+            simplex = np.concatenate([
+                record["state"][None, :],
+                record["state"][None, :] + (axis * np.sqrt(eigs)).T,
+            ])
+            scipy_options = dict(solver.options["scipy_options"])
+            scipy_options["initial_simplex"] = simplex
+            solver.options["scipy_options"] = scipy_options
+    return np.copy(record["state"])
@@ -1,16 +1,274 @@
+from collections import OrderedDict
+
+import numpy as np
+from astropy.time import TimeDelta
+
+
+def _generate_states(state_generator, state0, times):
+    return state_generator.get_states(state0, times)
+
+
 class StateGenerator:
+    executor = None
+    """Optional `concurrent.futures.Executor` used to generate batches of states
+    concurrently when the generator cannot vectorize over input states. The
+    executor is not pickled with the generator.
+    """
+
+    in_frame = None
+    """Frame of the input states, None if it is the same as the output frame"""
+    out_frame = None
+    """Frame of the generated states, None if it is the same as the input frame"""
+
+    def to_input_frame(self, states, times):
+        """Convert (6, N) generated states at `times` to the frame of the input states.
+        Override this for generators where the frames differ.
+        """
+        if self.in_frame == self.out_frame:
+            return states
+        raise NotImplementedError(
+            f"{type(self).__name__} cannot convert {self.out_frame} states to {self.in_frame}"
+        )
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("executor", None)
+        return state
+
     def get_states(self, state0, times):
         raise NotImplementedError()
 
+    def get_states_batch(self, states0, times):
+        """Generate states for a (K, n_var) batch of input states, returns a
+        (K, 6, len(times)) array. Override this if the generator can vectorize
+        over input states.
+        """
+        if self.executor is None:
+            states = [self.get_states(state0, times) for state0 in states0]
+        else:
+            num = len(states0)
+            states = list(self.executor.map(
+                _generate_states, [self] * num, states0, [times] * num,
+            ))
+        return np.stack(states, axis=0)
+
 
 class sortsPropagator(StateGenerator):
-    def __init__(self, epoch, propagator, propagator_args={}):
+    def __init__(self, epoch, propagator, propagator_args={}, executor=None):
         self.propagator = propagator
         self.epoch = epoch
+        self.executor = executor
 
         self.propagator_args = propagator_args
 
+    @property
+    def in_frame(self):
+        return self.propagator.settings.get("in_frame")
+
+    @property
+    def out_frame(self):
+        return self.propagator.settings.get("out_frame")
+
+    def to_input_frame(self, states, times):
+        if self.in_frame == self.out_frame:
+            return states
+        import sorts
+
+        return sorts.frames.convert(
+            times, states, in_frame=self.out_frame, out_frame=self.in_frame,
+        )
+
     def get_states(self, state0, times):
         times = times
         t = (times - self.epoch).sec
         return self.propagator.propagate(t, state0, self.epoch, **self.propagator_args)
+
+
+class CachedStateGenerator(StateGenerator):
+    """Memoization layer around a state generator. Generated states are stored
+    in a least recently used cache keyed on the exact bytes of the input state
+    and the times, so repeated states are never propagated twice.
+
+    The returned arrays are shared with the cache and are set as read-only.
+    """
+
+    def __init__(self, state_generator, maxsize=128):
+        self.state_generator = state_generator
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._times = None
+        self._times_key = None
+
+    def _get_times_key(self, times):
+        if times is not self._times:
+            self._times = times
+            self._times_key = hash((times.jd1.tobytes(), times.jd2.tobytes()))
+        return self._times_key
+
+    def _get_key(self, state0, times):
+        state0 = np.ascontiguousarray(state0, dtype=np.float64)
+        return (state0.tobytes(), self._get_times_key(times))
+
+    def _lookup(self, key):
+        states = self._cache.get(key, None)
+        if states is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._cache.move_to_end(key)
+        return states
+
+    def _store(self, key, states):
+        states = np.asarray(states)
+        states.flags.writeable = False
+        self._cache[key] = states
+        if self.maxsize is not None and len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+        return states
+
+    def get_states(self, state0, times):
+        key = self._get_key(state0, times)
+        states = self._lookup(key)
+        if states is None:
+            states = self._store(key, self.state_generator.get_states(state0, times))
+        return states
+
+    def get_states_batch(self, states0, times):
+        """Only the states missing from the cache are passed on as a batch"""
+        states0 = np.atleast_2d(states0)
+        keys = [self._get_key(state0, times) for state0 in states0]
+        found = [self._lookup(key) for key in keys]
+        missing = [ind for ind, states in enumerate(found) if states is None]
+        if len(missing) > 0:
+            new_states = self.state_generator.get_states_batch(states0[missing, :], times)
+            for ind, states in zip(missing, new_states):
+                found[ind] = self._store(keys[ind], states)
+        return np.stack(found, axis=0)
+
+    def cache_info(self):
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            maxsize=self.maxsize,
+            currsize=len(self._cache),
+        )
+
+    def cache_clear(self):
+        self._cache.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+def hermite_interpolate(t0, states0, t1, states1, t):
+    """Cubic Hermite interpolation of positions and velocities between two sets
+    of (6, N) states at times `t0` and `t1`, evaluated at times `t`.
+    The velocities are the time derivative of the interpolating polynomial.
+    """
+    h = t1 - t0
+    s = (t - t0) / h
+    s2 = s**2
+    s3 = s2 * s
+
+    p0, v0 = states0[:3, :], states0[3:, :] * h
+    p1, v1 = states1[:3, :], states1[3:, :] * h
+
+    states = np.empty((6, len(t)), dtype=np.float64)
+    # Hermite basis polynomials and their derivatives
+    h00, h10, h01, h11 = 2 * s3 - 3 * s2 + 1, s3 - 2 * s2 + s, -2 * s3 + 3 * s2, s3 - s2
+    d00, d10, d01, d11 = 6 * s2 - 6 * s, 3 * s2 - 4 * s + 1, -6 * s2 + 6 * s, 3 * s2 - 2 * s
+
+    states[:3, :] = h00 * p0 + h10 * v0 + h01 * p1 + h11 * v1
+    states[3:, :] = (d00 * p0 + d10 * v0 + d01 * p1 + d11 * v1) / h
+    return states
+
+
+class InterpolatedStateGenerator(StateGenerator):
+    """Propagates on a coarse grid of nodes and interpolates positions and velocities
+    onto the requested times using cubic Hermite interpolation.
+
+    The requested times are split into segments wherever there is a gap larger than
+    `max_step` [s] and each segment is covered by nodes at most `max_step` apart.
+    Node intervals are then refined by bisection until the interpolation error at
+    the interval midpoint is below `tolerance` [m] in position and
+    `velocity_tolerance` [m/s] in velocity. Times in intervals that do not reach
+    the tolerance within `max_refinements` bisections are propagated directly.
+    """
+
+    def __init__(
+        self,
+        state_generator,
+        max_step=60.0,
+        tolerance=1.0,
+        velocity_tolerance=np.inf,
+        max_refinements=8,
+    ):
+        self.state_generator = state_generator
+        self.max_step = max_step
+        self.tolerance = tolerance
+        self.velocity_tolerance = velocity_tolerance
+        self.max_refinements = max_refinements
+
+    def _get_nodes(self, t):
+        t = np.unique(t)
+        gaps = np.flatnonzero(np.diff(t) > self.max_step)
+        starts = np.concatenate([[0], gaps + 1])
+        ends = np.concatenate([gaps, [len(t) - 1]])
+
+        nodes = []
+        for start, end in zip(starts, ends):
+            num = int(np.ceil((t[end] - t[start]) / self.max_step))
+            nodes.append(np.linspace(t[start], t[end], num=num + 1))
+        return np.unique(np.concatenate(nodes))
+
+    def _propagate(self, state0, tref, t):
+        return self.state_generator.get_states(state0, tref + TimeDelta(t, format="sec"))
+
+    def get_states(self, state0, times):
+        tref = times[0]
+        t = (times - tref).sec
+
+        nodes = self._get_nodes(t)
+        if len(nodes) < 2 or len(t) <= 2 * len(nodes):
+            return self.state_generator.get_states(state0, times)
+        node_states = self._propagate(state0, tref, nodes)
+        verified = np.zeros((len(nodes),), dtype=bool)
+
+        for refinement in range(self.max_refinements + 1):
+            ind = np.clip(np.searchsorted(nodes, t, side="right") - 1, 0, len(nodes) - 2)
+            interior = np.logical_and(t > nodes[ind], t < nodes[ind + 1])
+            check = np.unique(ind[interior])
+            check = check[np.logical_not(verified[check])]
+            if len(check) == 0 or refinement == self.max_refinements:
+                break
+
+            mids = 0.5 * (nodes[check] + nodes[check + 1])
+            mid_states = self._propagate(state0, tref, mids)
+            interp = hermite_interpolate(
+                nodes[check], node_states[:, check],
+                nodes[check + 1], node_states[:, check + 1],
+                mids,
+            )
+            err = interp - mid_states
+            bad = np.logical_or(
+                np.linalg.norm(err[:3, :], axis=0) > self.tolerance,
+                np.linalg.norm(err[3:, :], axis=0) > self.velocity_tolerance,
+            )
+            verified[check[np.logical_not(bad)]] = True
+
+            insert = check[bad] + 1
+            nodes = np.insert(nodes, insert, mids[bad])
+            node_states = np.insert(node_states, insert, mid_states[:, bad], axis=1)
+            verified = np.insert(verified, insert, False)
+
+        states = hermite_interpolate(
+            nodes[ind], node_states[:, ind], nodes[ind + 1], node_states[:, ind + 1], t,
+        )
+
+        direct = np.isin(ind, check)
+        direct[np.logical_not(interior)] = False
+        if np.any(direct):
+            states[:, direct] = self._propagate(state0, tref, t[direct])
+
+        return states
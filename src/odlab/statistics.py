@@ -1,11 +1,33 @@
 from typing import Optional
 import numpy as np
+import scipy.fft
+
+BLOCK_SIZE = 100000
+
+
+def _in_memory(chain) -> bool:
+    """If the chain is a numpy array in memory and not e.g. a `numpy.memmap`
+    or a h5py dataset"""
+    return isinstance(chain, np.ndarray) and not isinstance(chain, np.memmap)
+
+
+def _iter_blocks(chain, block_size: int, index: tuple = (), stop: Optional[int] = None):
+    """Iterate over (N, block_size) blocks of the (N, M) chain `chain[index]`,
+    up to step `stop`, reading one block at a time"""
+    if stop is None:
+        stop = chain.shape[len(index) + 1]
+    for start in range(0, stop, block_size):
+        yield np.asarray(
+            chain[index + (slice(None), slice(start, min(start + block_size, stop)))],
+            dtype=np.float64,
+        )
 
 
 def autocovariance(
     chain: np.ndarray,
     max_k: Optional[int] = None,
     min_k: Optional[int] = None,
+    block_size: Optional[int] = None,
 ) -> np.ndarray:
     """Calculate the natural estimator of the autocovariance function of a Markov chain.
 
@@ -23,6 +45,14 @@ def autocovariance(
         \\hat{\\mu}_n = \\frac{1}{n} \\sum_{i=1}^{n} g(X_i)
     $$
 
+    All lags are computed at once for all dimensions through the FFT of the
+    zero-padded chain, costing $O(N M \\log M)$.
+
+    A chain that is not in memory, e.g. a `numpy.memmap` or a h5py dataset, or any
+    chain if `block_size` is given, is read in blocks of `block_size` steps. With
+    `max_k` given the lag-limited products are accumulated block by block using
+    `RunningAutocovariance`, otherwise the FFT is done one dimension at a time.
+
     Parameters
     ----------
     chain : np.ndarray
@@ -32,6 +62,8 @@ def autocovariance(
         The maximum autocorrelation length
     min_k : optional, int
         The minimum autocorrelation length
+    block_size : optional, int
+        Number of steps to read at a time
 
     Returns
     -------
@@ -40,7 +72,6 @@ def autocovariance(
 
     """
     _n = chain.shape[1]
-    dims = chain.shape[0]
 
     if max_k is None:
         max_k = _n
@@ -54,36 +85,489 @@ def autocovariance(
         if min_k >= _n:
             min_k = _n - 1
 
-    gamma = np.empty(
-        (
-            dims,
-            max_k - min_k,
-        ),
-        dtype=chain.dtype,
-    )
-    mu = np.mean(chain, axis=1)
+    if not _in_memory(chain) or block_size is not None:
+        if block_size is None:
+            block_size = BLOCK_SIZE
+        gamma, _ = _blocked_autocovariance(chain, max_k, block_size)
+        return gamma[:, min_k:]
+
+    # Zero padding to at least 2n turns the circular correlation into the linear one
+    nfft = scipy.fft.next_fast_len(2 * _n)
+    centered = chain - np.mean(chain, axis=1, keepdims=True)
+    spectrum = scipy.fft.rfft(centered, n=nfft, axis=1)
+    gamma = scipy.fft.irfft(spectrum * np.conj(spectrum), n=nfft, axis=1)[:, min_k:max_k]
 
+    return (gamma / float(_n)).astype(chain.dtype, copy=False)
+
+
+def _blocked_autocovariance(chain, max_k: int, block_size: int, index: tuple = ()):
+    """Autocovariance up to `max_k` and mean of the (N, M) chain `chain[index]`, read
+    in blocks of `block_size` steps if `max_k < M` and otherwise one dimension at a time
+    """
+    dims, _n = chain.shape[len(index):]
+    if max_k < _n:
+        acov = RunningAutocovariance(dims, max_k)
+        for block in _iter_blocks(chain, block_size, index=index):
+            acov.update_chunk(block)
+        return acov.autocovariance, acov.total / acov.count
+
+    gamma = np.empty((dims, _n), dtype=np.float64)
+    mean = np.empty((dims,), dtype=np.float64)
     for vari in range(dims):
-        for k in range(min_k, max_k):
-            covi = chain[vari, :(_n - k)] - mu[vari]
-            covik = chain[vari, k:_n] - mu[vari]
-            gamma[vari, k] = np.sum(covi * covik) / float(_n)
+        row = np.asarray(chain[index + (slice(vari, vari + 1), slice(None))], dtype=np.float64)
+        gamma[vari, :] = autocovariance(row)[0, :]
+        mean[vari] = np.mean(row)
+    return gamma, mean
 
-    return gamma
 
+def integrated_autocorrelation_time(chains: np.ndarray, c: float = 5.0) -> np.ndarray:
+    """Estimate the integrated autocorrelation time of Markov chains.
+
+    The integrated autocorrelation time is
+    $$
+        \\tau = 1 + 2 \\sum_{k=1}^{W} \\rho_k
+    $$
+    where $\\rho_k$ is the autocorrelation function, averaged over the chains, and the
+    window $W$ is chosen automatically as the smallest $W \\geq c \\tau(W)$ [1].
+
+    Parameters
+    ----------
+    chains : np.ndarray
+        The Markov chains represented as a (C, N, M) matrix where C is the number of
+        chains, N is the number of dimensions and M is the number of steps.
+        A single (N, M) chain is also accepted.
+    c : float
+        The window size in units of the autocorrelation time
+
+    Returns
+    -------
+    numpy.ndarray
+        (N,) vector of integrated autocorrelation times
+
+    [1] Sokal, A. (1997). Monte Carlo methods in statistical mechanics: foundations
+        and new algorithms. In Functional integration (pp. 131-192). Springer.
+    """
+    chains = _as_chains(chains)
+    gamma = np.mean(np.stack([autocovariance(chain) for chain in chains], axis=0), axis=0)
+    rho = gamma / gamma[:, :1]
+
+    taus = 2.0 * np.cumsum(rho, axis=1) - 1.0
+    windows = np.arange(taus.shape[1])
+
+    tau = np.empty((chains.shape[1],), dtype=np.float64)
+    for vari in range(chains.shape[1]):
+        valid = np.flatnonzero(windows >= c * taus[vari, :])
+        window = valid[0] if len(valid) > 0 else len(windows) - 1
+        tau[vari] = taus[vari, window]
+    return tau
+
+
+def batch_mean(chain, batch_size, block_size: Optional[int] = None):
+    """Calculate the means of consecutive non-overlapping batches of a Markov chain.
+
+    A chain that is not in memory, e.g. a `numpy.memmap` or a h5py dataset, or any
+    chain if `block_size` is given, is read in blocks of about `block_size` steps
+    rounded to whole batches.
+
+    Parameters
+    ----------
+    chain : np.ndarray
+        The Markov chain represented as a (N, M) matrix where N is the number of dimensions
+        and M is the number of steps
+    batch_size : int
+        Number of steps in each batch, steps after the last full batch are ignored
+    block_size : optional, int
+        Number of steps to read at a time
 
-def batch_mean(chain, batch_size):
+    Returns
+    -------
+    numpy.ndarray
+        (N, M // batch_size) matrix of batch means
+    """
     _n = chain.shape[1]
     dims = chain.shape[0]
     if batch_size > _n:
         raise Exception("Not enough samples to calculate batch statistics")
 
-    _max = batch_size
     batches = _n // batch_size
-    batch_mean = np.empty((dims, batches,), dtype=chain.dtype)
-    for ind in range(batches):
-        batch = chain[:, (_max - batch_size):_max]
-        _max += batch_size
-        batch_mean[:, ind] = np.mean(batch, axis=1)
 
-    return batch_mean
+    if not _in_memory(chain) or block_size is not None:
+        if block_size is None:
+            block_size = BLOCK_SIZE
+        block_size = max(block_size // batch_size, 1) * batch_size
+        return np.concatenate([
+            batch_mean(block, batch_size)
+            for block in _iter_blocks(chain, block_size, stop=batches * batch_size)
+        ], axis=1)
+
+    batch = chain[:, :(batches * batch_size)].reshape(dims, batches, batch_size)
+    return np.mean(batch, axis=2)
+
+
+def _as_chains(chains):
+    chains = np.asarray(chains)
+    if chains.ndim == 2:
+        chains = chains[None, :, :]
+    return chains
+
+
+def split_rhat(chains: np.ndarray) -> np.ndarray:
+    """Calculate the split potential scale reduction factor $\\hat{R}$ of Markov chains.
+
+    Each chain is split in two halves and $\\hat{R}$ is calculated over all halves as
+    $$
+        \\hat{R} = \\sqrt{\\frac{\\frac{n - 1}{n} W + \\frac{1}{n} B}{W}}
+    $$
+    where $W$ is the mean within-chain variance and $B$ the between-chain variance [1].
+
+    Parameters
+    ----------
+    chains : np.ndarray
+        The Markov chains represented as a (C, N, M) matrix where C is the number of
+        chains, N is the number of dimensions and M is the number of steps.
+        A single (N, M) chain is also accepted.
+
+    Returns
+    -------
+    numpy.ndarray
+        (N,) vector of split $\\hat{R}$ values
+
+    [1] Gelman, A., et al. (2013). Bayesian Data Analysis, Third Edition.
+    """
+    chains = _as_chains(chains)
+    half = chains.shape[2] // 2
+    splits = np.concatenate([chains[:, :, :half], chains[:, :, -half:]], axis=0)
+
+    within = np.mean(np.var(splits, axis=2, ddof=1), axis=0)
+    between = half * np.var(np.mean(splits, axis=2), axis=0, ddof=1)
+    var_plus = (half - 1) / half * within + between / half
+
+    return np.sqrt(var_plus / within)
+
+
+def effective_sample_size(
+    chains: np.ndarray,
+    max_k: Optional[int] = None,
+    block_size: Optional[int] = None,
+) -> np.ndarray:
+    """Calculate the effective sample size of Markov chains.
+
+    The autocorrelation is combined over all chains and the sum of the
+    autocorrelation function is truncated using Geyer's initial monotone
+    sequence estimator [1].
+
+    Chains that are not in memory, e.g. a `numpy.memmap` or a h5py dataset, or any
+    chains if `block_size` is given, are read one chain at a time in blocks of
+    `block_size` steps, see `autocovariance`. Limiting the autocorrelation to
+    `max_k` lags, which should be well above the autocorrelation time, keeps the
+    memory use independent of the chain length.
+
+    Parameters
+    ----------
+    chains : np.ndarray
+        The Markov chains represented as a (C, N, M) matrix where C is the number of
+        chains, N is the number of dimensions and M is the number of steps.
+        A single (N, M) chain is also accepted.
+    max_k : optional, int
+        The maximum autocorrelation length
+    block_size : optional, int
+        Number of steps to read at a time
+
+    Returns
+    -------
+    numpy.ndarray
+        (N,) vector of effective sample sizes
+
+    [1] Gelman, A., et al. (2013). Bayesian Data Analysis, Third Edition.
+    """
+    if _in_memory(chains) and block_size is None:
+        chains = _as_chains(chains)
+        gamma = np.stack([autocovariance(chain, max_k=max_k) for chain in chains], axis=0)
+        means = np.mean(chains, axis=2)
+    else:
+        if block_size is None:
+            block_size = BLOCK_SIZE
+        indices = [(ind,) for ind in range(chains.shape[0])] if len(chains.shape) == 3 else [()]
+        _n = chains.shape[-1]
+        results = [
+            _blocked_autocovariance(
+                chains, _n if max_k is None else min(max_k, _n), block_size, index=index,
+            )
+            for index in indices
+        ]
+        gamma = np.stack([chain_gamma for chain_gamma, _ in results], axis=0)
+        means = np.stack([chain_mean for _, chain_mean in results], axis=0)
+
+    num_chains, dims = means.shape
+    _n = chains.shape[-1]
+    within = np.mean(gamma[:, :, 0], axis=0) * _n / (_n - 1.0)
+    var_plus = within * (_n - 1.0) / _n
+    if num_chains > 1:
+        var_plus += np.var(means, axis=0, ddof=1)
+
+    rho = 1.0 - (within[:, None] - np.mean(gamma, axis=0)) / var_plus[:, None]
+
+    ess = np.empty((dims,), dtype=np.float64)
+    for vari in range(dims):
+        pairs = rho[vari, :(rho.shape[1] // 2) * 2].reshape(-1, 2).sum(axis=1)
+        negative = np.flatnonzero(pairs < 0)
+        if len(negative) > 0:
+            pairs = pairs[:negative[0]]
+        pairs = np.minimum.accumulate(pairs)
+        tau = -1.0 + 2.0 * np.sum(pairs)
+        ess[vari] = num_chains * _n / max(tau, 1.0 / np.log10(num_chains * _n))
+
+    return ess
+
+
+class RunningCovariance:
+    """Running mean and covariance of a stream of samples.
+
+    Each sample is added as a rank-one update using Welford's algorithm, costing
+    $O(N^2)$ for N dimensions independently of the number of samples seen. Chunks
+    of samples and other accumulators are merged using the pairwise update of [1].
+
+    Parameters
+    ----------
+    dims : int
+        Number of dimensions N of the samples
+
+    [1] Chan, T. F., Golub, G. H., LeVeque, R. J. (1983). Algorithms for computing
+        the sample variance: Analysis and recommendations. The American
+        Statistician, 37(3), 242-247.
+    """
+
+    def __init__(self, dims: int):
+        self.count = 0
+        self.mean = np.zeros((dims,), dtype=np.float64)
+        self.scatter = np.zeros((dims, dims), dtype=np.float64)
+
+    def update(self, sample: np.ndarray):
+        """Add a (N,) sample"""
+        self.count += 1
+        delta = sample - self.mean
+        self.mean += delta / self.count
+        self.scatter += np.outer(delta, sample - self.mean)
+
+    def _merge(self, count, mean, scatter):
+        if count == 0:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.scatter += scatter + np.outer(delta, delta) * (self.count * count / total)
+        self.mean += delta * (count / total)
+        self.count = total
+
+    def update_chunk(self, chunk: np.ndarray):
+        """Add a (N, M) chunk of M samples"""
+        chunk = np.asarray(chunk, dtype=np.float64)
+        if chunk.shape[1] == 0:
+            return
+        mean = np.mean(chunk, axis=1)
+        centered = chunk - mean[:, None]
+        self._merge(chunk.shape[1], mean, centered @ centered.T)
+
+    def merge(self, other: "RunningCovariance"):
+        """Add all samples of another accumulator"""
+        self._merge(other.count, other.mean, other.scatter)
+
+    @property
+    def covariance(self) -> np.ndarray:
+        """Unbiased (N, N) sample covariance"""
+        if self.count < 2:
+            return np.full(self.scatter.shape, np.nan, dtype=np.float64)
+        return self.scatter / (self.count - 1)
+
+
+class BatchMeansMCSE:
+    """Running Monte Carlo standard error of the mean of a Markov chain using
+    non-overlapping batch means.
+
+    Parameters
+    ----------
+    dims : int
+        Number of dimensions N of the samples
+    batch_size : int
+        Number of consecutive samples in each batch
+    """
+
+    def __init__(self, dims: int, batch_size: int):
+        self.batch_size = batch_size
+        self.batch_means = RunningCovariance(dims)
+        self._batch_sum = np.zeros((dims,), dtype=np.float64)
+        self._batch_count = 0
+
+    def update_chunk(self, chunk: np.ndarray):
+        """Add a (N, M) chunk of M consecutive samples"""
+        chunk = np.asarray(chunk, dtype=np.float64)
+        start = 0
+        if self._batch_count > 0:
+            start = min(self.batch_size - self._batch_count, chunk.shape[1])
+            self._batch_sum += np.sum(chunk[:, :start], axis=1)
+            self._batch_count += start
+            if self._batch_count == self.batch_size:
+                self.batch_means.update(self._batch_sum / self.batch_size)
+                self._batch_sum[:] = 0.0
+                self._batch_count = 0
+
+        full = (chunk.shape[1] - start) // self.batch_size
+        stop = start + full * self.batch_size
+        if full > 0:
+            self.batch_means.update_chunk(batch_mean(chunk[:, start:stop], self.batch_size))
+
+        if stop < chunk.shape[1]:
+            self._batch_sum += np.sum(chunk[:, stop:], axis=1)
+            self._batch_count += chunk.shape[1] - stop
+
+    @property
+    def batches(self) -> int:
+        return self.batch_means.count
+
+    @property
+    def mean(self) -> np.ndarray:
+        """(N,) mean over all completed batches"""
+        return self.batch_means.mean
+
+    @property
+    def mcse(self) -> np.ndarray:
+        """(N,) Monte Carlo standard error of the mean"""
+        return np.sqrt(np.diag(self.batch_means.covariance) / self.batches)
+
+
+class QuantileSketch:
+    """Approximate quantiles of a stream of samples using fixed-size histograms.
+
+    Each dimension has a histogram of `bins` equal width bins that is widened by
+    merging neighbouring bins whenever samples fall outside of its range, so the
+    memory is fixed and the quantile error is bounded by the bin width, i.e. the
+    range of the samples divided by about half the number of bins.
+
+    Parameters
+    ----------
+    dims : int
+        Number of dimensions N of the samples
+    bins : int
+        Even number of histogram bins per dimension
+    """
+
+    def __init__(self, dims: int, bins: int = 4096):
+        if bins % 2 != 0:
+            raise ValueError(f"Number of bins must be even, not {bins}")
+        self.bins = bins
+        self.counts = np.zeros((dims, bins), dtype=np.int64)
+        self.low = np.full((dims,), np.nan, dtype=np.float64)
+        self.high = np.full((dims,), np.nan, dtype=np.float64)
+
+    def _widen(self, vari, low, high):
+        half = self.bins // 2
+        while low < self.low[vari] or high >= self.high[vari]:
+            width = self.high[vari] - self.low[vari]
+            merged = self.counts[vari, :].reshape(half, 2).sum(axis=1)
+            self.counts[vari, :] = 0
+            if low < self.low[vari]:
+                self.counts[vari, half:] = merged
+                self.low[vari] -= width
+            else:
+                self.counts[vari, :half] = merged
+                self.high[vari] += width
+
+    def update_chunk(self, chunk: np.ndarray):
+        """Add a (N, M) chunk of M samples"""
+        chunk = np.asarray(chunk, dtype=np.float64)
+        if chunk.shape[1] == 0:
+            return
+        low = np.min(chunk, axis=1)
+        high = np.max(chunk, axis=1)
+        for vari in range(chunk.shape[0]):
+            if np.isnan(self.low[vari]):
+                margin = max(high[vari] - low[vari], abs(high[vari]) * 1e-9, 1e-12)
+                self.low[vari] = low[vari]
+                self.high[vari] = high[vari] + margin / self.bins
+            self._widen(vari, low[vari], high[vari])
+
+            width = (self.high[vari] - self.low[vari]) / self.bins
+            inds = ((chunk[vari, :] - self.low[vari]) / width).astype(np.int64)
+            np.clip(inds, 0, self.bins - 1, out=inds)
+            self.counts[vari, :] += np.bincount(inds, minlength=self.bins)
+
+    def quantile(self, q) -> np.ndarray:
+        """Approximate quantiles `q` in [0, 1], returns a (N, len(q)) matrix"""
+        q = np.atleast_1d(np.asarray(q, dtype=np.float64))
+        result = np.empty((self.counts.shape[0], len(q)), dtype=np.float64)
+        for vari in range(self.counts.shape[0]):
+            cdf = np.concatenate([[0], np.cumsum(self.counts[vari, :])])
+            edges = np.linspace(self.low[vari], self.high[vari], self.bins + 1)
+            result[vari, :] = np.interp(q * cdf[-1], cdf, edges)
+        return result
+
+
+class RunningAutocovariance:
+    """Running lag-limited autocovariance of a Markov chain, the streaming
+    counterpart of `autocovariance(chain, max_k)`.
+
+    The lagged products are accumulated over consecutive chunks keeping only the
+    first and last `max_k` samples, costing $O(N M K)$ per chunk of M samples.
+
+    Parameters
+    ----------
+    dims : int
+        Number of dimensions N of the samples
+    max_k : int
+        The maximum autocorrelation length K
+    """
+
+    def __init__(self, dims: int, max_k: int):
+        self.max_k = max_k
+        self.count = 0
+        self.total = np.zeros((dims,), dtype=np.float64)
+        self.products = np.zeros((dims, max_k), dtype=np.float64)
+        self.head = np.empty((dims, 0), dtype=np.float64)
+        self.tail = np.empty((dims, 0), dtype=np.float64)
+
+    def update_chunk(self, chunk: np.ndarray):
+        """Add a (N, M) chunk of M consecutive samples"""
+        chunk = np.asarray(chunk, dtype=np.float64)
+        num = chunk.shape[1]
+        combined = np.concatenate([self.tail, chunk], axis=1)
+        offset = self.tail.shape[1]
+
+        for k in range(min(self.max_k, offset + num)):
+            first = max(k - offset, 0)
+            self.products[:, k] += np.sum(
+                combined[:, (offset + first - k):(offset + num - k)] * chunk[:, first:],
+                axis=1,
+            )
+
+        self.count += num
+        self.total += np.sum(chunk, axis=1)
+        if self.head.shape[1] < self.max_k:
+            self.head = np.concatenate([self.head, chunk[:, :self.max_k]], axis=1)[:, :self.max_k]
+        self.tail = combined[:, -self.max_k:] if self.max_k > 0 else self.tail
+
+    @property
+    def autocovariance(self) -> np.ndarray:
+        """(N, K') autocovariance with K' = min(K, samples seen)"""
+        max_k = min(self.max_k, self.count)
+        mu = self.total / self.count
+        k = np.arange(max_k)
+        head_sums = np.cumsum(np.concatenate([np.zeros((len(mu), 1)), self.head], axis=1), axis=1)
+        tail_sums = np.cumsum(
+            np.concatenate([np.zeros((len(mu), 1)), self.tail[:, ::-1]], axis=1), axis=1
+        )
+        # Sums over the first n - k and the last n - k samples
+        first = self.total[:, None] - tail_sums[:, k]
+        last = self.total[:, None] - head_sums[:, k]
+        mean_products = (self.count - k)[None, :] * mu[:, None]**2
+        gamma = self.products[:, :max_k] - mu[:, None] * (first + last) + mean_products
+        return gamma / self.count
+
+
+def feed_blocks(chain, accumulators, block_size: int = BLOCK_SIZE):
+    """Feed a (N, M) chain, e.g. a `numpy.memmap` or a h5py dataset, to
+    accumulators in blocks of `block_size` samples so that the chain is never
+    loaded into memory at once.
+    """
+    for block in _iter_blocks(chain, block_size):
+        for accumulator in accumulators:
+            accumulator.update_chunk(block)
+    return accumulators
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+'''Shared test state generators and targets
+
+'''
+
+import time
+import numpy as np
+
+from odlab.methods import StateGenerator
+
+
+class LinearMotion(StateGenerator):
+    '''Constant velocity motion, cheap enough to compare against brute force.
+    Each call can be slowed down by `delay` seconds.
+    '''
+
+    def __init__(self, epoch, delay=0.0):
+        self.epoch = epoch
+        self.delay = delay
+
+    def get_states(self, state0, times):
+        if self.delay > 0:
+            time.sleep(self.delay)
+        t = (times - self.epoch).sec
+        states = np.empty((6, len(t)), dtype=np.float64)
+        states[:3, :] = state0[:3, None] + state0[3:, None] * t[None, :]
+        states[3:, :] = state0[3:, None]
+        return states
+
+
+class GaussianTarget:
+    """Gaussian log-posterior with a known mean and covariance"""
+
+    def __init__(self, mean, cov):
+        self.mean = mean
+        self.cov = cov
+        self.cov_inv = np.linalg.inv(cov)
+        self.prior = None
+
+    def logposterior(self, state):
+        dx = state - self.mean
+        return -0.5 * dx @ self.cov_inv @ dx
+
+    def logposterior_batch(self, states):
+        dx = np.atleast_2d(states) - self.mean[None, :]
+        return -0.5 * np.sum((dx @ self.cov_inv) * dx, axis=1)
+
+    def linear_covariance_estimate(self, state, deltas, prior_cov_inv=None):
+        return self.cov
+
+    def __call__(self, state):
+        return self.logposterior(state)
+
+
+class CorrelatedGaussianCase:
+    """Test case mixin sampling a correlated three dimensional `GaussianTarget`"""
+
+    def setUp(self):
+        self.mean = np.array([1.0, -2.0, 0.5])
+        self.cov = np.array([
+            [1.0, 0.8, 0.0],
+            [0.8, 1.0, 0.0],
+            [0.0, 0.0, 0.25],
+        ])
+        self.posterior = GaussianTarget(self.mean, self.cov)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+'''Test the batch runner
+
+'''
+
+import json
+import pathlib
+import tempfile
+import unittest
+import numpy as np
+from astropy.time import Time, TimeDelta
+
+import odlab
+from odlab import batch
+from odlab.data.hdf import save_radar_hdfs
+
+from helpers import LinearMotion
+
+
+def save_object(path, epoch, state, num):
+    t = np.arange(num, dtype=np.float64) * 10.0
+    times = epoch + TimeDelta(t, format="sec")
+    meta = dict(
+        tx_ecef=np.array([6400e3, 0, 0], dtype=np.float64),
+        rx_ecef=np.array([6400e3, 100e3, 0], dtype=np.float64),
+    )
+    radar = odlab.get_model(meta, "radar_pair")
+    sim = radar.evaluate(times.datetime64, LinearMotion(epoch).get_states(state, times))
+    df = odlab.build_source(
+        times.datetime64,
+        meta,
+        r=sim["r"],
+        r_sd=np.full((num,), 10.0),
+        v=sim["v"],
+        v_sd=np.full((num,), 1.0),
+    )
+    path.mkdir()
+    save_radar_hdfs(path / "pass.h5", df)
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.tmp.name)
+        self.epoch = Time("2020-01-01T00:00:00", format="isot", scale="utc")
+        self.state = [7000e3, 0, 0, 0, 7.5e3, 1e3]
+
+        for name, num in [("small", 10), ("large", 400)]:
+            save_object(self.path / name, self.epoch, np.array(self.state), num)
+
+        self.manifest = self.path / "manifest.json"
+        self.results = self.path / "results.jsonl"
+        self.write_manifest([
+            dict(id="small", path="small"),
+            dict(id="large", path="large"),
+        ])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write_manifest(self, jobs):
+        manifest = dict(
+            defaults=dict(
+                sources={"radar_hdf": "*.h5"},
+                model="radar_pair",
+                epoch=self.epoch.isot,
+                state_generator="helpers:LinearMotion",
+                solver="scipy_maximize",
+                options=dict(progress_bar=False, scipy_options=dict(maxiter=20)),
+                start=self.state,
+            ),
+            jobs=jobs,
+        )
+        with open(self.manifest, "w") as fh:
+            json.dump(manifest, fh)
+
+    def test_load_manifest(self):
+        jobs = batch.load_manifest(self.manifest)
+        self.assertEqual(jobs[0]["path"], str(self.path / "small"))
+        self.assertEqual(jobs[0]["posterior"], "gaussian_error")
+        self.assertGreater(batch.job_size(jobs[1]), batch.job_size(jobs[0]))
+
+    def test_run_batch(self):
+        records = batch.run_batch(batch.load_manifest(self.manifest), self.results, processes=1)
+
+        # Largest job first
+        self.assertEqual([record["id"] for record in records], ["large", "small"])
+        stored = batch.load_results(self.results)
+        self.assertEqual(set(stored.keys()), {"small", "large"})
+        for record in stored.values():
+            self.assertEqual(record["status"], "done")
+            self.assertEqual(len(record["result"]["x"]), 6)
+
+        # Done jobs are skipped
+        self.assertEqual(batch.run_batch(batch.load_manifest(self.manifest), self.results), [])
+
+    def test_failures(self):
+        self.write_manifest([
+            dict(id="missing", path="small", solver="not_a_solver"),
+            dict(id="slow", path="small", state_generator_args=dict(delay=10.0)),
+        ])
+        records = batch.run_batch(
+            batch.load_manifest(self.manifest),
+            self.results,
+            processes=2,
+            timeout=1.0,
+            retries=1,
+        )
+        records = {record["id"]: record for record in records}
+        self.assertEqual(records["missing"]["status"], "failed")
+        self.assertIn("not_a_solver", records["missing"]["error"])
+        self.assertEqual(records["missing"]["attempts"], 2)
+        self.assertEqual(records["slow"]["status"], "timeout")
+        self.assertEqual(records["slow"]["attempts"], 2)
+
+    def test_main(self):
+        self.assertEqual(batch.main([str(self.manifest), "-p", "2"]), 0)
+        self.assertEqual(len(batch.load_results(self.path / "results.jsonl")), 2)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+
+'''Test posterior evaluation
+
+'''
+
+import unittest
+import numpy as np
+import numpy.testing as nt
+from astropy.time import Time, TimeDelta
+
+import odlab
+from odlab.methods.posterior import GaussianError
+from odlab.methods.posterior.gaussian_error import information_matrix, invert_information
+
+from helpers import LinearMotion
+
+
+def build_measurements(epoch, state, num, offset, seed):
+    np.random.seed(seed)
+    t = offset + np.arange(num, dtype=np.float64) * 2.0
+    dates = (epoch + TimeDelta(t, format="sec")).datetime64
+
+    radar = odlab.get_model(
+        dict(
+            tx_ecef=np.array([6400e3, 0, 0], dtype=np.float64),
+            rx_ecef=np.array([6400e3, 100e3, 0], dtype=np.float64),
+        ),
+        "radar_pair",
+    )
+    states = LinearMotion(epoch).get_states(
+        state, epoch + TimeDelta(t, format="sec")
+    )
+    sim = radar.evaluate(dates, states)
+    radar_df = odlab.build_source(
+        dates,
+        {},
+        r=sim["r"] + np.random.randn(num) * 10.0,
+        r_sd=np.full((num,), 10.0),
+        v=sim["v"] + np.random.randn(num),
+        v_sd=np.full((num,), 1.0),
+    )
+
+    est = odlab.get_model({}, "estimated_state")
+    sim = est.evaluate(dates, states)
+    data = {}
+    for var in est.OUTPUT_DATA:
+        data[var] = sim[var] + np.random.randn(num) * 100.0
+        data[var + "_sd"] = np.full((num,), 100.0)
+    est_df = odlab.build_source(dates, {}, **data)
+
+    return [(radar, [radar_df]), (est, [est_df])]
+
+
+class TestGaussianError(unittest.TestCase):
+
+    def setUp(self):
+        self.epoch = Time("2020-01-01T00:00:00", format="isot", scale="utc")
+        self.state = np.array([7000e3, 0, 0, 0, 7.5e3, 1e3], dtype=np.float64)
+        self.measurements = build_measurements(
+            self.epoch, self.state, num=20, offset=0.0, seed=1234
+        )
+        self.posterior = GaussianError(self.measurements, LinearMotion(self.epoch))
+
+    def brute_force_loglikelihood(self, state):
+        gen = LinearMotion(self.epoch)
+        logsum = 0.0
+        for model, dfs in self.measurements:
+            for df in dfs:
+                times = Time(df["date"].values, format="datetime64", scale="utc")
+                sim = model.evaluate(df["date"], gen.get_states(state, times))
+                for var in model.OUTPUT_DATA:
+                    logsum -= np.sum(((df[var].values - sim[var]) / df[var + "_sd"].values)**2)
+        return 0.5 * logsum
+
+    def test_loglikelihood(self):
+        for dx in [0.0, 10.0, 1e3]:
+            state = self.state.copy()
+            state[0] += dx
+            nt.assert_almost_equal(
+                self.posterior.loglikelihood(state),
+                self.brute_force_loglikelihood(state),
+            )
+
+    def test_logposterior_batch(self):
+        states = np.tile(self.state, (4, 1))
+        states[:, 0] += np.array([0.0, 10.0, -50.0, 1e3])
+        states[:, 4] += np.array([0.0, 1.0, -2.0, 0.1])
+        batch = self.posterior.logposterior_batch(states)
+        self.assertEqual(batch.shape, (4,))
+        for ind in range(4):
+            nt.assert_almost_equal(batch[ind], self.posterior.logposterior(states[ind, :]))
+
+    def test_model_jacobian_estimate(self):
+        deltas = np.array([1.0, 1.0, 1.0, 0.1, 0.1, 0.1])
+        data0, J, Sigma = self.posterior.model_jacobian_estimate(self.state, deltas)
+        _, Jc, _ = self.posterior.model_jacobian_estimate(self.state, deltas, central=True)
+
+        self.assertEqual(J.shape, (self.posterior.size, 6))
+        self.assertEqual(Sigma.shape, (self.posterior.size,))
+        nt.assert_allclose(J, Jc, rtol=1e-3, atol=1e-3)
+
+        # Estimated state "x" slice: dx/dx0 = 1 and dx/dvx0 = t
+        x_slice = self.posterior._var_slices[1]["x"]
+        t = (self.posterior.times - self.epoch).sec[self.posterior._state_inds[1]]
+        nt.assert_allclose(J[x_slice, 0], 1.0, rtol=1e-6)
+        nt.assert_allclose(J[x_slice, 3], t, rtol=1e-6, atol=1e-6)
+
+    def test_linear_covariance_estimate(self):
+        deltas = np.array([1.0, 1.0, 1.0, 0.1, 0.1, 0.1])
+        _, J, Sigma = self.posterior.model_jacobian_estimate(self.state, deltas)
+        dense = J.T @ np.diag(1.0 / Sigma) @ J
+        self.assertGreater(self.posterior.size, 7)
+        nt.assert_allclose(
+            information_matrix(J, self.posterior._inv_sd, chunk_size=7), dense, rtol=1e-10,
+        )
+
+        cov = self.posterior.linear_covariance_estimate(self.state, deltas, chunk_size=7)
+        nt.assert_allclose(cov, np.linalg.inv(dense), rtol=1e-8)
+
+        prior_cov_inv = np.diag([1e-4, 1e-4, 1e-4, 1.0, 1.0, 1.0])
+        cov = self.posterior.linear_covariance_estimate(
+            self.state, deltas, prior_cov_inv=prior_cov_inv, chunk_size=7,
+        )
+        nt.assert_allclose(cov, np.linalg.inv(dense + prior_cov_inv), rtol=1e-8)
+
+    def test_invert_information(self):
+        information = np.array([[2.0, 0.5], [0.5, 1.0]])
+        nt.assert_allclose(invert_information(information), np.linalg.inv(information))
+
+        # Indefinite matrices fall back to the general inverse
+        indefinite = np.array([[1.0, 2.0], [2.0, 1.0]])
+        with self.assertLogs("odlab.methods.posterior.gaussian_error", level="WARNING"):
+            nt.assert_allclose(invert_information(indefinite), np.linalg.inv(indefinite))
+
+    def test_time_rows(self):
+        states = np.tile(self.state, (2, 1))
+        states[1, 0] += 10.0
+        sims = self.posterior._simulate_batch(states)
+
+        rows = self.posterior.time_rows()
+        self.assertEqual(len(rows), len(self.posterior.times))
+        flat = []
+        for time_ind, time_rows in enumerate(rows):
+            flat_inds = np.concatenate([flat_inds for _, _, flat_inds in time_rows])
+            flat.append(flat_inds)
+            obs, var = self.posterior.observations_at(time_ind, rows=time_rows)
+            nt.assert_array_equal(obs, self.posterior._obs[flat_inds])
+            nt.assert_allclose(var, self.posterior._inv_sd[flat_inds]**-2)
+            nt.assert_allclose(
+                self.posterior.simulate_at(states, time_ind), sims[:, flat_inds], rtol=1e-12,
+            )
+        nt.assert_array_equal(np.sort(np.concatenate(flat)), np.arange(self.posterior.size))
+
+    def test_add_measurements(self):
+        states = np.tile(self.state, (3, 1))
+        states[:, 0] += np.array([0.0, 10.0, -50.0])
+
+        # Overlapping the existing pass, after it and interleaved with all of them
+        passes = [
+            build_measurements(self.epoch, self.state, num=30, offset=-10.0, seed=3),
+            build_measurements(self.epoch, self.state, num=10, offset=300.0, seed=1),
+            build_measurements(self.epoch, self.state, num=30, offset=-11.0, seed=2),
+        ]
+        for new_measurements in passes:
+            for model, dfs in new_measurements:
+                self.posterior.add_measurements(model, dfs)
+            self.measurements += new_measurements
+
+            full = GaussianError(self.measurements, LinearMotion(self.epoch))
+            nt.assert_array_equal(self.posterior.times.datetime64, full.times.datetime64)
+            nt.assert_almost_equal(
+                self.posterior.logposterior_batch(states),
+                full.logposterior_batch(states),
+            )
+            for state in states:
+                nt.assert_almost_equal(
+                    self.posterior.loglikelihood(state),
+                    self.brute_force_loglikelihood(state),
+                )
+
+    def test_unscented_covariance_estimate(self):
+        deltas = np.array([1.0, 1.0, 1.0, 0.01, 0.01, 0.01])
+        start = self.state + np.array([50.0, -50.0, 20.0, 0.5, -0.5, 0.2])
+
+        # Only the linear estimated state measurements: exact in one iteration
+        est = GaussianError(self.measurements[1:], LinearMotion(self.epoch))
+        resid, J = est.whitened_jacobian_estimate(start, deltas)
+        xhat = start + np.linalg.lstsq(J, resid, rcond=None)[0]
+        state, cov = est.unscented_covariance_estimate(start, deltas, maxiter=2)
+        std = np.sqrt(np.diag(cov))
+        nt.assert_array_less(np.abs(state - xhat), 1e-6 * std)
+        nt.assert_allclose(cov, np.linalg.inv(J.T @ J), rtol=1e-4, atol=1e-12)
+
+        state, cov = self.posterior.unscented_covariance_estimate(start, deltas)
+        lin_cov = self.posterior.linear_covariance_estimate(state, deltas)
+        nt.assert_allclose(cov, cov.T)
+        nt.assert_array_less(np.abs(state - self.state), 5 * np.sqrt(np.diag(cov)))
+        nt.assert_allclose(np.sqrt(np.diag(cov)), np.sqrt(np.diag(lin_cov)), rtol=0.1)
+
+    def test_residuals(self):
+        resids = self.posterior.residuals(self.state)
+        self.assertEqual(len(resids), 2)
+        self.assertEqual(set(resids[0].keys()), {"r", "v"})
+        for (model, dfs), resid in zip(self.measurements, resids):
+            for var in model.OUTPUT_DATA:
+                self.assertEqual(resid[var].shape, (len(dfs[0]),))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
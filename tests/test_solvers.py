@@ -0,0 +1,648 @@
+#!/usr/bin/env python
+
+'''Test solvers on a linear Gaussian problem
+
+'''
+
+import pathlib
+import tempfile
+import unittest
+import numpy as np
+import numpy.testing as nt
+from astropy.time import Time, TimeDelta
+
+import odlab
+from odlab.methods.posterior import GaussianError
+from odlab.methods import solvers
+
+from helpers import LinearMotion, GaussianTarget, CorrelatedGaussianCase
+
+
+def build_posterior(epoch, state, num=50, seed=1234, posterior_class=GaussianError):
+    np.random.seed(seed)
+    t = np.arange(num, dtype=np.float64) * 10.0
+    times = epoch + TimeDelta(t, format="sec")
+    generator = LinearMotion(epoch)
+
+    model = odlab.get_model({}, "estimated_state")
+    sim = model.evaluate(times.datetime64, generator.get_states(state, times))
+    data = {}
+    for var in model.OUTPUT_DATA:
+        std = 100.0 if var in ["x", "y", "z"] else 1.0
+        data[var] = sim[var] + np.random.randn(num) * std
+        data[var + "_sd"] = np.full((num,), std)
+    df = odlab.build_source(times.datetime64, {}, **data)
+
+    return posterior_class([(model, [df])], generator)
+
+
+class TestLevenbergMarquardt(unittest.TestCase):
+
+    def setUp(self):
+        self.epoch = Time("2020-01-01T00:00:00", format="isot", scale="utc")
+        self.state = np.array([7000e3, 0, 0, 0, 7.5e3, 1e3], dtype=np.float64)
+        self.posterior = build_posterior(self.epoch, self.state)
+        self.start = self.state + np.array([1e3, -1e3, 500.0, 5.0, -5.0, 2.0])
+
+    def test_registered(self):
+        self.assertIs(odlab.SOLVERS["levenberg_marquardt"], solvers.LevenbergMarquardt)
+
+    def test_run(self):
+        deltas = np.array([1.0, 1.0, 1.0, 0.01, 0.01, 0.01])
+        solver = solvers.LevenbergMarquardt(jacobian_delta=deltas, progress_bar=False)
+        result = solver.run(self.posterior, self.start)
+        self.assertTrue(result.success)
+        self.assertLess(result.nfev, 20)
+
+        # Linear problem: the normal equations give the exact solution
+        resid, J = self.posterior.whitened_jacobian_estimate(self.start, deltas)
+        xhat = self.start + np.linalg.lstsq(J, resid, rcond=None)[0]
+        cov = np.linalg.inv(J.T @ J)
+        nt.assert_array_less(np.abs(result.x - xhat), 1e-2 * np.sqrt(np.diag(cov)))
+        nt.assert_allclose(result.cov, cov, rtol=1e-6)
+        nt.assert_almost_equal(-result.fun, self.posterior.loglikelihood(result.x))
+
+
+class TestTelemetry(unittest.TestCase):
+
+    def setUp(self):
+        self.epoch = Time("2020-01-01T00:00:00", format="isot", scale="utc")
+        self.state = np.array([7000e3, 0, 0, 0, 7.5e3, 1e3], dtype=np.float64)
+        self.posterior = build_posterior(self.epoch, self.state, num=10)
+
+    def test_metrics(self):
+        recorder = solvers.MetricsRecorder()
+        solver = solvers.Scam(
+            np.array([10.0, 10.0, 10.0, 0.1, 0.1, 0.1]),
+            tune=0,
+            progress_bar=False,
+            callbacks=[recorder],
+            telemetry_interval=0.0,
+        )
+        solver.run(self.posterior, self.state, 200, seed=1)
+
+        self.assertEqual(len(recorder.history), 201)
+        metrics = recorder.last
+        self.assertEqual(metrics["solver"], "Scam")
+        self.assertEqual(metrics["iterations"], 200)
+        self.assertEqual(metrics["evaluations"], 200)
+        self.assertGreater(metrics["propagation_time"], 0.0)
+        self.assertGreater(metrics["model_time"], 0.0)
+        self.assertLessEqual(metrics["last"], metrics["best"])
+
+    def test_rate_limit(self):
+        recorder = solvers.MetricsRecorder()
+        solver = solvers.ScipyMaximize(
+            progress_bar=False,
+            callbacks=[recorder],
+            telemetry_interval=3600.0,
+            scipy_options=dict(maxiter=50),
+        )
+        result = solver.run(self.posterior, self.state)
+
+        self.assertEqual(len(recorder.history), 1)
+        self.assertEqual(recorder.last["evaluations"], result.nfev)
+        self.assertIsNone(recorder.last["acceptance"])
+        nt.assert_almost_equal(recorder.last["best"], -result.fun)
+
+
+class TestSequentialFilter(unittest.TestCase):
+
+    def setUp(self):
+        self.epoch = Time("2020-01-01T00:00:00", format="isot", scale="utc")
+        self.state = np.array([7000e3, 0, 0, 0, 7.5e3, 1e3], dtype=np.float64)
+        self.posterior = build_posterior(self.epoch, self.state, num=20)
+        self.deltas = np.array([1.0, 1.0, 1.0, 0.01, 0.01, 0.01])
+        self.start = self.state + np.array([1e3, -1e3, 500.0, 5.0, -5.0, 2.0])
+        self.start_cov = np.diag([1e4, 1e4, 1e4, 100.0, 100.0, 100.0])**2
+
+    def test_registered(self):
+        self.assertIs(odlab.SOLVERS["sequential_filter"], solvers.SequentialFilter)
+
+    def test_batch_equivalence(self):
+        # Linear problem with a wide start: the filter gives the batch solution
+        resid, J = self.posterior.whitened_jacobian_estimate(self.start, self.deltas)
+        cov = np.linalg.inv(J.T @ J + np.linalg.inv(self.start_cov))
+        xhat = self.start + cov @ (J.T @ resid)
+
+        for method in ["ekf", "ukf"]:
+            solver = solvers.SequentialFilter(
+                filter=method, jacobian_delta=self.deltas, smoother=True, progress_bar=False,
+            )
+            result = solver.run(self.posterior, self.start, self.start_cov)
+            self.assertEqual(result.states.shape, (20, 6))
+            self.assertEqual(result.nis.shape, (20,))
+            nt.assert_array_less(np.abs(result.x - xhat), 1e-3 * np.sqrt(np.diag(cov)))
+            nt.assert_allclose(result.cov, cov, rtol=1e-3, atol=1e-9)
+
+            # Without process noise the smoothed estimates all equal the final one
+            nt.assert_allclose(result.smoothed_states, np.tile(result.x, (20, 1)), rtol=1e-9)
+
+    def test_process_noise(self):
+        solver = solvers.SequentialFilter(
+            jacobian_delta=self.deltas,
+            process_noise=np.eye(6) * 1e-4,
+            smoother=True,
+            progress_bar=False,
+        )
+        result = solver.run(self.posterior, self.start, self.start_cov)
+        smoothed_std = np.sqrt(np.diagonal(result.smoothed_covs, axis1=1, axis2=2))
+        filtered_std = np.sqrt(np.diagonal(result.covs, axis1=1, axis2=2))
+        nt.assert_array_less(smoothed_std, filtered_std * (1 + 1e-9))
+        self.assertFalse(hasattr(
+            solvers.SequentialFilter(progress_bar=False).run(
+                self.posterior, self.start, self.start_cov,
+            ),
+            "states",
+        ))
+
+
+class InterruptedTarget(GaussianTarget):
+    """Raises after a number of evaluations to simulate a crashed run"""
+
+    def __init__(self, mean, cov, max_calls):
+        super().__init__(mean, cov)
+        self.max_calls = max_calls
+        self.calls = 0
+
+    def logposterior(self, state):
+        self.calls += 1
+        if self.calls > self.max_calls:
+            raise KeyboardInterrupt()
+        return super().logposterior(state)
+
+
+class TestScipyMaximize(unittest.TestCase):
+
+    def setUp(self):
+        self.epoch = Time("2020-01-01T00:00:00", format="isot", scale="utc")
+        self.state = np.array([7000e3, 0, 0, 0, 7.5e3, 1e3], dtype=np.float64)
+        self.posterior = build_posterior(self.epoch, self.state)
+
+    def test_multistart(self):
+        solver = solvers.ScipyMaximize(
+            starts=3,
+            start_std=np.array([100.0, 100.0, 100.0, 1.0, 1.0, 1.0]),
+            seed=1,
+            progress_bar=False,
+            scipy_options=dict(maxiter=50),
+        )
+        result = solver.run(self.posterior, self.state)
+        self.assertEqual(len(result.local_optima), 3)
+        self.assertEqual(result.starts.shape, (3, 6))
+        nt.assert_array_equal(result.x, result.local_optima[0].x)
+        funs = [optimum.fun for optimum in result.local_optima]
+        self.assertEqual(funs, sorted(funs))
+
+    def test_multistart_needs_samples(self):
+        solver = solvers.ScipyMaximize(starts=3, progress_bar=False)
+        with self.assertRaises(ValueError):
+            solver.run(self.posterior, self.state)
+
+
+class TestScam(CorrelatedGaussianCase, unittest.TestCase):
+
+    def test_seed(self):
+        solver = solvers.Scam(np.full((3,), 0.5), tune=100, progress_bar=False)
+        chain1 = solver.run(self.posterior, self.mean, 500, seed=42)
+        chain2 = solver.run(self.posterior, self.mean, 500, seed=42)
+        self.assertEqual(chain1.shape, (3, 500))
+        nt.assert_array_equal(chain1, chain2)
+
+    def test_linsigma_moments(self):
+        solver = solvers.Scam(
+            np.full((3,), 1.0),
+            proposal="LinSigma",
+            tune=1000,
+            adapt_interval=500,
+            progress_bar=False,
+        )
+        chain = solver.run(self.posterior, self.mean, 20000, seed=1)
+        nt.assert_allclose(np.mean(chain, axis=1), self.mean, atol=0.1)
+        nt.assert_allclose(np.cov(chain), self.cov, atol=0.1)
+
+    def test_adaptive_moments(self):
+        solver = solvers.Scam(
+            np.full((3,), 0.5),
+            proposal="adaptive",
+            tune=2000,
+            adapt_interval=500,
+            proposal_adapt_interval=1000,
+            progress_bar=False,
+        )
+        chain = solver.run(self.posterior, self.mean, 20000, seed=2)
+        nt.assert_allclose(np.mean(chain, axis=1), self.mean, atol=0.1)
+        nt.assert_allclose(np.cov(chain), self.cov, atol=0.1)
+
+    def test_run_chains(self):
+        solver = solvers.Scam(
+            np.full((3,), 1.0),
+            proposal="LinSigma",
+            tune=500,
+            progress_bar=False,
+        )
+        chains, diagnostics = solver.run_chains(
+            self.posterior, self.mean, 2000, chains=3, seed=7,
+        )
+        self.assertEqual(chains.shape, (3, 3, 2000))
+        self.assertFalse(np.allclose(chains[0, :, :], chains[1, :, :]))
+        nt.assert_array_less(diagnostics["rhat"], 1.1)
+        nt.assert_array_less(100.0, diagnostics["ess"])
+
+        chains2, _ = solver.run_chains(
+            self.posterior, self.mean, 2000, chains=3, seed=7,
+        )
+        nt.assert_array_equal(chains, chains2)
+
+
+class TestEnsembleSampler(CorrelatedGaussianCase, unittest.TestCase):
+
+    def test_registered(self):
+        self.assertIs(odlab.SOLVERS["mcmc_ensemble"], solvers.EnsembleSampler)
+
+    def test_moments(self):
+        solver = solvers.EnsembleSampler(
+            walkers=16,
+            tune=200,
+            start_std=np.full((3,), 0.1),
+            progress_bar=False,
+        )
+        chain = solver.run(self.posterior, self.mean, 2000, seed=5)
+        self.assertEqual(chain.shape, (16, 3, 2000))
+        samples = np.concatenate(chain, axis=1)
+        nt.assert_allclose(np.mean(samples, axis=1), self.mean, atol=0.1)
+        nt.assert_allclose(np.cov(samples), self.cov, atol=0.1)
+
+    def test_walkers(self):
+        solver = solvers.EnsembleSampler(walkers=5, progress_bar=False)
+        with self.assertRaises(ValueError):
+            solver.run(self.posterior, np.zeros((5, 3)), 10)
+
+
+class PickleCountingTarget(GaussianTarget):
+    """Counts how many times the target is pickled"""
+
+    pickles = 0
+
+    def __getstate__(self):
+        type(self).pickles += 1
+        return self.__dict__
+
+
+class TestEnsembleProcesses(unittest.TestCase):
+
+    def test_processes(self):
+        PickleCountingTarget.pickles = 0
+        mean = np.array([1.0, -2.0])
+        posterior = PickleCountingTarget(mean, np.diag([1.0, 0.25]))
+        kwargs = dict(walkers=8, tune=10, start_std=np.full((2,), 0.1), progress_bar=False)
+
+        chain = solvers.EnsembleSampler(**kwargs).run(posterior, mean, 50, seed=3)
+        parallel_chain = solvers.EnsembleSampler(processes=2, **kwargs).run(
+            posterior, mean, 50, seed=3,
+        )
+        nt.assert_allclose(parallel_chain, chain)
+
+        # The posterior is sent at most once per worker, not with every chunk
+        self.assertLessEqual(PickleCountingTarget.pickles, 2)
+
+
+class CountingError(GaussianError):
+    """Counts the full posterior evaluations"""
+
+    calls = 0
+
+    def __call__(self, state):
+        self.calls += 1
+        return super().__call__(state)
+
+
+class TestDelayedAcceptance(unittest.TestCase):
+
+    def setUp(self):
+        self.epoch = Time("2020-01-01T00:00:00", format="isot", scale="utc")
+        self.state = np.array([7000e3, 0, 0, 0, 7.5e3, 1e3], dtype=np.float64)
+        self.posterior = build_posterior(
+            self.epoch, self.state, num=20, posterior_class=CountingError,
+        )
+        self.deltas = np.array([1.0, 1.0, 1.0, 0.01, 0.01, 0.01])
+
+    def test_surrogate(self):
+        surrogate = self.posterior.linearized_logposterior(self.state, self.deltas)
+        state = self.state + np.array([10.0, -20.0, 5.0, 0.1, 0.2, -0.1])
+        nt.assert_allclose(surrogate(state), self.posterior.logposterior(state), rtol=1e-6)
+
+    def test_moments(self):
+        resid, J = self.posterior.whitened_jacobian_estimate(self.state, self.deltas)
+        xhat = self.state + np.linalg.lstsq(J, resid, rcond=None)[0]
+        cov = np.linalg.inv(J.T @ J)
+        std = np.sqrt(np.diag(cov))
+
+        solver = solvers.Scam(
+            std,
+            delayed_acceptance=True,
+            jacobian_delta=self.deltas,
+            surrogate_interval=2000,
+            tune=1000,
+            progress_bar=False,
+        )
+        chain = solver.run(self.posterior, xhat, 10000, seed=6)
+
+        # The surrogate is exact for a linear model so only accepted proposals
+        # need the full posterior
+        self.assertLess(self.posterior.calls, 0.6 * 11000)
+        nt.assert_array_less(np.abs(np.mean(chain, axis=1) - xhat), 0.2 * std)
+        nt.assert_allclose(np.std(chain, axis=1), std, rtol=0.2)
+
+
+class BimodalTarget:
+    """Equal mixture of two unit Gaussians separated along the first axis"""
+
+    prior = None
+
+    def __init__(self, separation):
+        self.offset = np.zeros((2,))
+        self.offset[0] = 0.5 * separation
+
+    def __call__(self, state):
+        return np.logaddexp(
+            -0.5 * np.sum((state - self.offset) ** 2),
+            -0.5 * np.sum((state + self.offset) ** 2),
+        )
+
+
+class TestParallelTempering(unittest.TestCase):
+
+    def setUp(self):
+        self.posterior = BimodalTarget(10.0)
+        self.start = np.array([5.0, 0.0])
+
+    def test_registered(self):
+        self.assertIs(odlab.SOLVERS["mcmc_tempering"], solvers.ParallelTempering)
+
+    def test_modes(self):
+        solver = solvers.ParallelTempering(
+            np.full((2,), 1.0),
+            num_temperatures=5,
+            max_temperature=50.0,
+            swap_interval=10,
+            tune=1000,
+            progress_bar=False,
+        )
+        chain, stats = solver.run(self.posterior, self.start, 20000, seed=4)
+        self.assertEqual(chain.shape, (2, 20000))
+        self.assertEqual(stats["swap_tries"].shape, (4,))
+        nt.assert_array_less(0.1, stats["swap_acceptance"])
+
+        # The cold chain alone would never leave the starting mode
+        nt.assert_allclose(np.mean(chain[0, :] > 0), 0.5, atol=0.15)
+        nt.assert_allclose(np.std(chain[1, :]), 1.0, atol=0.1)
+
+        chain2, _ = solver.run(self.posterior, self.start, 20000, seed=4)
+        nt.assert_array_equal(chain, chain2)
+
+    def test_processes(self):
+        PickleCountingTarget.pickles = 0
+        posterior = PickleCountingTarget(np.zeros((2,)), np.diag([1.0, 0.25]))
+        kwargs = dict(num_temperatures=4, swap_interval=50, tune=100, progress_bar=False)
+
+        chain, _ = solvers.ParallelTempering(np.full((2,), 1.0), **kwargs).run(
+            posterior, self.start, 1000, seed=4,
+        )
+        parallel_chain, _ = solvers.ParallelTempering(
+            np.full((2,), 1.0), processes=2, **kwargs,
+        ).run(posterior, self.start, 1000, seed=4)
+        nt.assert_array_equal(parallel_chain, chain)
+
+        # The posterior is sent at most once per worker, not with every segment
+        self.assertLessEqual(PickleCountingTarget.pickles, 2)
+
+    def test_temperatures(self):
+        solver = solvers.ParallelTempering(1.0, temperatures=[2.0, 4.0])
+        with self.assertRaises(ValueError):
+            solver.run(self.posterior, self.start, 10)
+
+
+class TestImportanceSampler(CorrelatedGaussianCase, unittest.TestCase):
+
+    def test_registered(self):
+        self.assertIs(odlab.SOLVERS["importance_sampling"], solvers.ImportanceSampler)
+
+    def test_exact_proposal(self):
+        solver = solvers.ImportanceSampler(chunk_size=300, progress_bar=False)
+        samples, stats = solver.run(self.posterior, self.mean, 2000, seed=3)
+        self.assertEqual(samples.shape, (3, 2000))
+        nt.assert_allclose(stats["weights"], 1.0 / 2000)
+        nt.assert_allclose(stats["ess"], 2000)
+        nt.assert_allclose(stats["log_evidence"], 0.5 * np.log(np.linalg.det(2 * np.pi * self.cov)))
+
+    def test_processes(self):
+        PickleCountingTarget.pickles = 0
+        posterior = PickleCountingTarget(self.mean, self.cov)
+        solver = solvers.ImportanceSampler(chunk_size=100, progress_bar=False)
+        states, stats = solver.run(posterior, self.mean, 2000, seed=2)
+
+        parallel = solvers.ImportanceSampler(chunk_size=100, processes=2, progress_bar=False)
+        parallel_states, parallel_stats = parallel.run(posterior, self.mean, 2000, seed=2)
+        nt.assert_array_equal(parallel_states, states)
+        nt.assert_allclose(parallel_stats["weights"], stats["weights"])
+
+        # The posterior is sent at most once per worker, not with every chunk
+        self.assertLessEqual(PickleCountingTarget.pickles, 2)
+
+    def test_moments(self):
+        solver = solvers.ImportanceSampler(proposal_scale=1.5, progress_bar=False)
+        start = self.mean + np.array([0.2, 0.2, -0.1])
+        _, stats = solver.run(self.posterior, start, 20000, seed=4)
+        self.assertLess(stats["ess"], 20000)
+        nt.assert_allclose(np.sum(stats["weights"]), 1.0)
+        nt.assert_allclose(stats["mean"], self.mean, atol=0.05)
+        nt.assert_allclose(stats["cov"], self.cov, atol=0.05)
+
+
+class TestHDF5ChainSink(unittest.TestCase):
+
+    def setUp(self):
+        self.mean = np.array([1.0, -2.0, 0.5])
+        self.cov = np.diag([1.0, 2.0, 0.5])
+        self.posterior = GaussianTarget(self.mean, self.cov)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.tmp.name) / "chain.h5"
+        self.options = dict(
+            tune=100,
+            progress_bar=False,
+            rng_block_size=64,
+            checkpoint_interval=150,
+        )
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_stream(self):
+        solver = solvers.Scam(np.full((3,), 0.5), **self.options)
+        chain = solver.run(self.posterior, self.mean, 1000, seed=3)
+
+        with solvers.HDF5ChainSink(self.path, chunk_size=64, thin=3, burn_in=10) as sink:
+            solver.run(self.posterior, self.mean, 1000, seed=3, sink=sink)
+            nt.assert_array_equal(sink.chain[()], chain[:, 10::3])
+            self.assertEqual(sink.logpost.shape, (sink.chain.shape[1],))
+
+    def test_resume(self):
+        solver = solvers.Scam(np.full((3,), 0.5), **self.options)
+        chain = solver.run(self.posterior, self.mean, 1000, seed=3)
+
+        interrupted = InterruptedTarget(self.mean, self.cov, max_calls=700)
+        with self.assertRaises(KeyboardInterrupt):
+            with solvers.HDF5ChainSink(self.path, chunk_size=64) as sink:
+                solver.run(interrupted, self.mean, 1000, seed=3, sink=sink)
+
+        with solvers.HDF5ChainSink(self.path, chunk_size=64) as sink:
+            sink.open(3)
+            self.assertEqual(sink.load_state()["index"], 600)
+            self.assertEqual(sink.chain.shape, (3, 500))
+            sink.close()
+
+            solver.run(self.posterior, self.mean, 1000, seed=3, sink=sink)
+            nt.assert_array_equal(sink.chain[()], chain)
+
+    def test_resume_accumulators(self):
+        solver = solvers.Scam(np.full((3,), 0.5), **self.options)
+        chain = solver.run(self.posterior, self.mean, 1000, seed=3)
+
+        interrupted = InterruptedTarget(self.mean, self.cov, max_calls=700)
+        with self.assertRaises(KeyboardInterrupt):
+            with solvers.HDF5ChainSink(self.path, chunk_size=64) as sink:
+                solver.run(interrupted, self.mean, 1000, seed=3, sink=sink)
+
+        running = odlab.statistics.RunningCovariance(3)
+        with solvers.HDF5ChainSink(self.path, chunk_size=64, accumulators=[running]) as sink:
+            solver.run(self.posterior, self.mean, 1000, seed=3, sink=sink)
+
+        self.assertEqual(running.count, 1000)
+        nt.assert_allclose(running.covariance, np.cov(chain))
+
+    def test_resume_adaptive(self):
+        solver = solvers.Scam(
+            np.full((3,), 0.5),
+            proposal="adaptive",
+            proposal_adapt_interval=200,
+            **self.options,
+        )
+        chain = solver.run(self.posterior, self.mean, 1000, seed=3)
+
+        interrupted = InterruptedTarget(self.mean, self.cov, max_calls=700)
+        with self.assertRaises(KeyboardInterrupt):
+            with solvers.HDF5ChainSink(self.path, chunk_size=64) as sink:
+                solver.run(interrupted, self.mean, 1000, seed=3, sink=sink)
+
+        with solvers.HDF5ChainSink(self.path, chunk_size=64) as sink:
+            solver.run(self.posterior, self.mean, 1000, seed=3, sink=sink)
+            nt.assert_array_equal(sink.chain[()], chain)
+
+
+class RotatedMotion(LinearMotion):
+    """Linear motion generating states in a frame rotated around the z-axis"""
+
+    in_frame = "INERTIAL"
+    out_frame = "ROTATED"
+
+    def __init__(self, epoch, angle=0.5, convert=True):
+        super().__init__(epoch)
+        c, s = np.cos(angle), np.sin(angle)
+        self.rot = np.array([[c, -s, 0], [s, c, 0], [0, 0, 1]])
+        self.convert = convert
+
+    def get_states(self, state0, times):
+        states = super().get_states(state0, times)
+        return np.concatenate([self.rot @ states[:3, :], self.rot @ states[3:, :]])
+
+    def to_input_frame(self, states, times):
+        if not self.convert:
+            return super().to_input_frame(states, times)
+        return np.concatenate([self.rot.T @ states[:3, :], self.rot.T @ states[3:, :]])
+
+
+class TestWarmStart(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = solvers.WarmStartStore(pathlib.Path(self.tmp.name) / "warm.h5")
+        self.epoch = Time("2020-01-01T00:00:00", format="isot", scale="utc")
+        self.state = np.array([7000e3, 0, 0, 0, 7.5e3, 1e3], dtype=np.float64)
+        self.cov = np.diag([100.0, 100.0, 100.0, 1.0, 1.0, 1.0])**2
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_store(self):
+        self.assertIsNone(self.store.load("obj"))
+        self.store.save("obj", self.epoch, self.state, cov=self.cov, solver="test")
+        self.store.save("obj", self.epoch + TimeDelta(86400.0, format="sec"), self.state + 1)
+
+        self.assertEqual(len(self.store.epochs("obj")), 2)
+        record = self.store.load("obj", self.epoch + TimeDelta(3600.0, format="sec"))
+        nt.assert_array_equal(record["state"], self.state)
+        nt.assert_array_equal(record["cov"], self.cov)
+        self.assertEqual(record["solver"], "test")
+        self.assertEqual(record["epoch"].isot, self.epoch.isot)
+
+        latest = self.store.load("obj")
+        nt.assert_array_equal(latest["state"], self.state + 1)
+        self.assertNotIn("cov", latest)
+
+    def test_propagate(self):
+        self.store.save("obj", self.epoch, self.state, cov=self.cov)
+        record = self.store.load("obj")
+        new_epoch = self.epoch + TimeDelta(100.0, format="sec")
+        propagated = solvers.propagate_record(
+            record, new_epoch, LinearMotion(self.epoch), deltas=1.0,
+        )
+
+        phi = np.eye(6)
+        phi[:3, 3:] = np.eye(3) * 100.0
+        nt.assert_allclose(propagated["state"], phi @ self.state)
+        nt.assert_allclose(propagated["cov"], phi @ self.cov @ phi.T, rtol=1e-6)
+        self.assertEqual(propagated["epoch"].isot, new_epoch.isot)
+
+    def test_propagate_frames(self):
+        self.store.save("obj", self.epoch, self.state, cov=self.cov)
+        record = self.store.load("obj")
+        new_epoch = self.epoch + TimeDelta(100.0, format="sec")
+        expected = solvers.propagate_record(
+            record, new_epoch, LinearMotion(self.epoch), deltas=1.0,
+        )
+        propagated = solvers.propagate_record(
+            record, new_epoch, RotatedMotion(self.epoch), deltas=1.0,
+        )
+        nt.assert_allclose(propagated["state"], expected["state"], atol=1e-6)
+        nt.assert_allclose(propagated["cov"], expected["cov"], rtol=1e-6, atol=1e-3)
+
+        with self.assertRaises(NotImplementedError):
+            solvers.propagate_record(
+                record, new_epoch, RotatedMotion(self.epoch, convert=False), deltas=1.0,
+            )
+
+    def test_apply(self):
+        target = GaussianTarget(np.zeros(3), np.diag([1.0, 4.0, 0.25]))
+        solver = solvers.Scam(
+            np.full((3,), 1.0), proposal="LinSigma", tune=500, progress_bar=False,
+        )
+        solver.run(target, np.zeros(3), 100, seed=1)
+        self.store.save_solver("obj", self.epoch, solver, np.zeros(3), cov=target.cov)
+
+        record = self.store.load("obj")
+        self.assertEqual(record["solver"], "Scam")
+        warm = solvers.Scam(np.full((3,), 1.0), tune=0, progress_bar=False)
+        start = solvers.apply_warm_start(warm, record)
+        nt.assert_array_equal(warm.base_step_size, solver.tuning["step"])
+        nt.assert_allclose(warm.options["proposal_cov"], target.cov)
+        warm.run(target, start, 100, seed=1)
+        nt.assert_array_equal(warm.tuning["step"], solver.tuning["step"])
+
+        maximize = solvers.ScipyMaximize(progress_bar=False)
+        solvers.apply_warm_start(maximize, record)
+        self.assertEqual(maximize.options["scipy_options"]["initial_simplex"].shape, (4, 3))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
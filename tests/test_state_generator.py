@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+'''Test state generators
+
+'''
+
+import unittest
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import numpy.testing as nt
+from astropy.time import Time, TimeDelta
+
+from odlab.methods import StateGenerator, CachedStateGenerator, InterpolatedStateGenerator
+
+
+class CountingMotion(StateGenerator):
+
+    def __init__(self, epoch):
+        self.epoch = epoch
+        self.calls = 0
+
+    def get_states(self, state0, times):
+        self.calls += 1
+        t = (times - self.epoch).sec
+        states = np.empty((6, len(t)), dtype=np.float64)
+        states[:3, :] = state0[:3, None] + state0[3:, None] * t[None, :]
+        states[3:, :] = state0[3:, None]
+        return states
+
+
+class CircularMotion(StateGenerator):
+
+    def __init__(self, epoch, radius=7000e3, period=6000.0):
+        self.epoch = epoch
+        self.radius = radius
+        self.omega = 2 * np.pi / period
+        self.calls = 0
+        self.num = 0
+
+    def get_states(self, state0, times):
+        self.calls += 1
+        self.num += len(times)
+        t = (times - self.epoch).sec
+        phase = self.omega * t + state0[0]
+        states = np.zeros((6, len(t)), dtype=np.float64)
+        states[0, :] = self.radius * np.cos(phase)
+        states[1, :] = self.radius * np.sin(phase)
+        states[3, :] = -self.radius * self.omega * np.sin(phase)
+        states[4, :] = self.radius * self.omega * np.cos(phase)
+        return states
+
+
+class TestCachedStateGenerator(unittest.TestCase):
+
+    def setUp(self):
+        self.epoch = Time("2020-01-01T00:00:00", format="isot", scale="utc")
+        self.times = self.epoch + TimeDelta(np.linspace(0, 100, 11), format="sec")
+        self.state = np.array([7000e3, 0, 0, 0, 7.5e3, 1e3], dtype=np.float64)
+        self.generator = CountingMotion(self.epoch)
+
+    def test_get_states(self):
+        cached = CachedStateGenerator(self.generator, maxsize=2)
+        states = cached.get_states(self.state, self.times)
+        states2 = cached.get_states(self.state.copy(), self.times)
+        self.assertEqual(self.generator.calls, 1)
+        nt.assert_array_equal(states, states2)
+        self.assertEqual(cached.cache_info()["hits"], 1)
+        self.assertEqual(cached.cache_info()["misses"], 1)
+
+        with self.assertRaises(ValueError):
+            states[0, 0] = 0
+
+    def test_eviction(self):
+        cached = CachedStateGenerator(self.generator, maxsize=2)
+        for dx in [0.0, 1.0, 2.0, 0.0]:
+            cached.get_states(self.state + dx, self.times)
+        self.assertEqual(self.generator.calls, 4)
+        self.assertEqual(cached.cache_info()["currsize"], 2)
+
+    def test_get_states_batch(self):
+        cached = CachedStateGenerator(self.generator)
+        cached.get_states(self.state, self.times)
+        states0 = np.stack([self.state, self.state + 1.0], axis=0)
+        states = cached.get_states_batch(states0, self.times)
+        self.assertEqual(states.shape, (2, 6, len(self.times)))
+        self.assertEqual(self.generator.calls, 2)
+        nt.assert_array_equal(states[1], self.generator.get_states(states0[1], self.times))
+
+
+class TestExecutor(unittest.TestCase):
+
+    def setUp(self):
+        self.epoch = Time("2020-01-01T00:00:00", format="isot", scale="utc")
+        self.times = self.epoch + TimeDelta(np.linspace(0, 100, 11), format="sec")
+        self.states0 = np.array([[7000e3, 0, 0, 0, 7.5e3, 1e3]]) + np.arange(4)[:, None]
+
+    def test_process_pool(self):
+        generator = CountingMotion(self.epoch)
+        ref = generator.get_states_batch(self.states0, self.times)
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            generator.executor = executor
+            states = generator.get_states_batch(self.states0, self.times)
+
+            copy = pickle.loads(pickle.dumps(generator))
+            self.assertIsNone(copy.executor)
+            self.assertIs(generator.executor, executor)
+        nt.assert_array_equal(states, ref)
+
+
+class TestInterpolatedStateGenerator(unittest.TestCase):
+
+    def setUp(self):
+        self.epoch = Time("2020-01-01T00:00:00", format="isot", scale="utc")
+        t = np.concatenate([np.arange(0, 600, 0.5), np.arange(5000, 5300, 0.2)])
+        self.times = self.epoch + TimeDelta(t, format="sec")
+        self.state = np.zeros((6,), dtype=np.float64)
+        self.generator = CircularMotion(self.epoch)
+
+    def test_get_states(self):
+        interp = InterpolatedStateGenerator(self.generator, max_step=120.0, tolerance=1e-2)
+        states = interp.get_states(self.state, self.times)
+        self.assertLess(self.generator.num, len(self.times) // 10)
+
+        ref = self.generator.get_states(self.state, self.times)
+        self.assertEqual(states.shape, ref.shape)
+        nt.assert_allclose(states[:3, :], ref[:3, :], rtol=0, atol=2e-2)
+        nt.assert_allclose(states[3:, :], ref[3:, :], rtol=0, atol=1e-2)
+
+    def test_direct_fallback(self):
+        interp = InterpolatedStateGenerator(
+            self.generator, max_step=600.0, tolerance=1e-6, max_refinements=0,
+        )
+        states = interp.get_states(self.state, self.times)
+        ref = self.generator.get_states(self.state, self.times)
+        nt.assert_allclose(states, ref, rtol=0, atol=1e-6)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
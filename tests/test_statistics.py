@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+
+'''Test Markov chain statistics
+
+'''
+
+import unittest
+import pathlib
+import tempfile
+
+import numpy as np
+import numpy.testing as nt
+import h5py
+
+import odlab.statistics as stats
+
+
+def ar1_chains(phi, chains, dims, steps, seed):
+    np.random.seed(seed)
+    chain = np.zeros((chains, dims, steps), dtype=np.float64)
+    for ind in range(1, steps):
+        chain[:, :, ind] = phi * chain[:, :, ind - 1] + np.random.randn(chains, dims)
+    return chain
+
+
+class TestConvergenceDiagnostics(unittest.TestCase):
+
+    def test_split_rhat(self):
+        chains = ar1_chains(0.5, 4, 2, 2000, seed=1)
+        nt.assert_array_less(stats.split_rhat(chains), 1.01)
+
+        chains[0, :, :] += 3.0
+        nt.assert_array_less(1.1, stats.split_rhat(chains))
+
+    def test_effective_sample_size(self):
+        phi = 0.8
+        chains = ar1_chains(phi, 4, 2, 4000, seed=2)
+        expected = 4 * 4000 * (1 - phi) / (1 + phi)
+        nt.assert_allclose(stats.effective_sample_size(chains), expected, rtol=0.25)
+
+        np.random.seed(3)
+        chain = np.random.randn(2, 4000)
+        nt.assert_allclose(stats.effective_sample_size(chain), 4000, rtol=0.1)
+
+
+class TestAutocovariance(unittest.TestCase):
+
+    def brute_force(self, chain, max_k):
+        _n = chain.shape[1]
+        mu = np.mean(chain, axis=1)
+        gamma = np.empty((chain.shape[0], max_k))
+        for k in range(max_k):
+            gamma[:, k] = np.sum(
+                (chain[:, :(_n - k)] - mu[:, None]) * (chain[:, k:] - mu[:, None]), axis=1
+            ) / _n
+        return gamma
+
+    def test_autocovariance(self):
+        chain = ar1_chains(0.7, 1, 3, 500, seed=5)[0]
+        expected = self.brute_force(chain, 500)
+        nt.assert_allclose(stats.autocovariance(chain), expected, atol=1e-12)
+        nt.assert_allclose(
+            stats.autocovariance(chain, max_k=40, min_k=10), expected[:, 10:40], atol=1e-12
+        )
+
+    def test_integrated_autocorrelation_time(self):
+        phi = 0.8
+        chains = ar1_chains(phi, 4, 2, 20000, seed=6)
+        nt.assert_allclose(
+            stats.integrated_autocorrelation_time(chains), (1 + phi) / (1 - phi), rtol=0.1
+        )
+
+
+class TestRunningCovariance(unittest.TestCase):
+
+    def test_covariance(self):
+        np.random.seed(4)
+        samples = np.random.randn(500, 3) @ np.array([
+            [1.0, 0.5, 0.0],
+            [0.0, 2.0, 0.0],
+            [0.0, 0.3, 0.1],
+        ]) + 10.0
+        running = stats.RunningCovariance(3)
+        for sample in samples:
+            running.update(sample)
+        self.assertEqual(running.count, 500)
+        nt.assert_allclose(running.mean, np.mean(samples, axis=0))
+        nt.assert_allclose(running.covariance, np.cov(samples.T))
+
+
+class TestStreamingStatistics(unittest.TestCase):
+
+    def setUp(self):
+        self.chain = ar1_chains(0.6, 1, 3, 5000, seed=7)[0] + np.array([[1.0], [-5.0], [1e3]])
+        sizes = [1, 7, 500, 1000, 13, 2479, 1000]
+        self.chunks = np.split(self.chain, np.cumsum(sizes)[:-1], axis=1)
+
+    def test_running_covariance(self):
+        running = stats.RunningCovariance(3)
+        other = stats.RunningCovariance(3)
+        for ind, chunk in enumerate(self.chunks):
+            (running if ind % 2 == 0 else other).update_chunk(chunk)
+        running.merge(other)
+        self.assertEqual(running.count, 5000)
+        nt.assert_allclose(running.mean, np.mean(self.chain, axis=1))
+        nt.assert_allclose(running.covariance, np.cov(self.chain))
+
+    def test_batch_means(self):
+        mcse = stats.BatchMeansMCSE(3, 100)
+        for chunk in self.chunks:
+            mcse.update_chunk(chunk)
+        means = stats.batch_mean(self.chain, 100)
+        self.assertEqual(mcse.batches, 50)
+        nt.assert_allclose(mcse.mean, np.mean(means, axis=1))
+        nt.assert_allclose(mcse.mcse, np.std(means, axis=1, ddof=1) / np.sqrt(50))
+
+    def test_quantile_sketch(self):
+        sketch = stats.QuantileSketch(3, bins=512)
+        for chunk in self.chunks:
+            sketch.update_chunk(chunk)
+        q = [0.05, 0.5, 0.95]
+        expected = np.quantile(self.chain, q, axis=1).T
+        width = (np.max(self.chain, axis=1) - np.min(self.chain, axis=1)) / 128
+        nt.assert_array_less(np.abs(sketch.quantile(q) - expected), np.tile(width[:, None], (1, 3)))
+
+    def test_running_autocovariance(self):
+        acov = stats.RunningAutocovariance(3, 50)
+        for chunk in self.chunks:
+            acov.update_chunk(chunk)
+        nt.assert_allclose(
+            acov.autocovariance, stats.autocovariance(self.chain, max_k=50), rtol=1e-6, atol=1e-8
+        )
+
+    def test_feed_blocks(self):
+        running, acov = stats.feed_blocks(
+            self.chain, [stats.RunningCovariance(3), stats.RunningAutocovariance(3, 10)],
+            block_size=333,
+        )
+        nt.assert_allclose(running.covariance, np.cov(self.chain))
+        nt.assert_allclose(
+            acov.autocovariance, stats.autocovariance(self.chain, max_k=10), rtol=1e-6, atol=1e-8
+        )
+
+
+class TestOutOfCore(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        path = pathlib.Path(self.dir.name)
+        self.chains = ar1_chains(0.8, 2, 3, 4000, seed=11)
+
+        self.memmap = np.memmap(
+            path / "chains.dat", dtype=np.float64, mode="w+", shape=self.chains.shape,
+        )
+        self.memmap[:] = self.chains
+        self.memmap.flush()
+
+        self.hf = h5py.File(path / "chains.h5", "w")
+        self.dataset = self.hf.create_dataset("chains", data=self.chains)
+        self.chain_dataset = self.hf.create_dataset("chain", data=self.chains[0])
+
+    def tearDown(self):
+        self.hf.close()
+        del self.memmap
+        self.dir.cleanup()
+
+    def test_batch_mean(self):
+        expected = stats.batch_mean(self.chains[0], 30)
+        self.assertEqual(expected.shape, (3, 133))
+        nt.assert_allclose(expected[:, 1], np.mean(self.chains[0, :, 30:60], axis=1))
+        for chain in [self.memmap[0], self.chain_dataset]:
+            nt.assert_allclose(stats.batch_mean(chain, 30, block_size=250), expected)
+
+    def test_autocovariance(self):
+        chain = self.chains[0]
+        for ooc in [self.memmap[0], self.chain_dataset]:
+            nt.assert_allclose(
+                stats.autocovariance(ooc, max_k=40, min_k=5, block_size=333),
+                stats.autocovariance(chain, max_k=40, min_k=5),
+                rtol=1e-6, atol=1e-8,
+            )
+            nt.assert_allclose(
+                stats.autocovariance(ooc, block_size=333), stats.autocovariance(chain),
+                rtol=1e-6, atol=1e-8,
+            )
+
+    def test_effective_sample_size(self):
+        expected = stats.effective_sample_size(self.chains)
+        for chains in [self.memmap, self.dataset]:
+            nt.assert_allclose(stats.effective_sample_size(chains, block_size=333), expected)
+            nt.assert_allclose(
+                stats.effective_sample_size(chains, max_k=200, block_size=333),
+                stats.effective_sample_size(self.chains, max_k=200),
+                rtol=1e-6,
+            )
+        nt.assert_allclose(
+            stats.effective_sample_size(self.dataset, max_k=200),
+            2 * 4000 * (1 - 0.8) / (1 + 0.8),
+            rtol=0.3,
+        )
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)